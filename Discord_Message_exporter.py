@@ -43,8 +43,6 @@ if not os.getenv('RAILWAY_ENVIRONMENT'):
 # 2. CONFIGURATION
 VERSION = "1.0.0"
 COMMAND_PREFIX = "/"
-DEFAULT_CHUNK_SIZE = 10000
-EXPORT_COOLDOWN = 5
 MAINTENANCE_MODE = False
 MEMORY_WARNING_THRESHOLD = 70
 MEMORY_CRITICAL_THRESHOLD = 85
@@ -56,11 +54,58 @@ STATE_FILE = "bot_state.json"
 LOG_MAX_SIZE = 5 * 1024 * 1024  # 5MB
 LOG_BACKUP_COUNT = 5
 LOG_RETENTION_DAYS = 30
-MAX_MESSAGES_EXCEL = 100000
+MAX_MESSAGES_EXCEL = 2000000  # rows per workbook, spread over several sheets
+UPLOAD_SIZE_MARGIN = 0.95  # cut parts at this fraction of the guild's upload limit
+EXCEL_SIZE_RATIO = 0.2  # assumed xlsx size / raw cell bytes until a part is measured (chat text is ~0.15)
+COMPRESSION_SIZE_RATIO = 0.35  # assumed compressed / raw CSV bytes until a block is compressed
+COMPRESSION_QUEUE_BLOCKS = 4  # CSV_WRITE_BUFFER-sized blocks waiting for the compressor
+SERIALIZATION_WORKERS = 2  # threads that finish (save/compress) part files
+SERIALIZATION_BACKEND = "thread"  # "thread" or "process" (build Excel parts in worker processes)
+SERIALIZATION_PROCESSES = 0  # worker processes for the process backend, 0 = one per CPU
+UPLOAD_QUEUE_SIZE = 2  # finished parts waiting for upload before writing waits
+UPLOAD_RETRIES = 5  # attempts per part upload
+UPLOAD_RETRY_DELAY = 2  # seconds, grows with each failed attempt
+PART_SPOOL_MAX_MEMORY = 16 * 1024 * 1024  # part bytes kept in memory before spilling to a temp file
+MAX_CONCURRENT_EXPORTS = 2  # exports running at once, the rest wait in the queue
+MAX_EXPORTS_PER_GUILD = 1  # running exports per guild
+MAX_EXPORTS_PER_USER = 1  # running exports per user
+MAX_QUEUED_EXPORTS = 20  # waiting exports before new ones are turned away
+EXPORT_HISTORY_SIZE = 20  # finished jobs kept for /queue
+ADMISSION_MEMORY_RESERVE = 200 * 1024 * 1024  # memory kept free for the bot itself
+ADMISSION_JOB_OVERHEAD = 16 * 1024 * 1024  # pipeline queues and fetch buffers per export
+ADMISSION_CELL_OVERHEAD = 50  # Python object bytes per buffered cell
+ADMISSION_MIN_PART_ROWS = 1000  # smallest part size a downgrade may choose
+EXPORT_CHECKPOINT_FILE = "export_jobs.json"  # unfinished exports, resumed on startup
+EXPORT_RESUME_ATTEMPTS = 3  # restarts that retry an export whose parts failed to upload
 MAX_MESSAGES_CSV = 500000
 RATE_LIMIT_DELAY = 0.25
 MAX_RETRIES = 5
+RETRY_MAX_DELAY = 30.0  # cap on the exponential backoff between retries
+PROGRESS_UPDATE_INTERVAL = 2.0  # seconds between progress message edits
+PROGRESS_MAX_INTERVAL = 30.0  # edit interval ceiling while Discord rate limits us
+PROGRESS_RATE_SMOOTHING = 0.3  # weight of the newest sample in the messages/sec average
+METRICS_PORT = int(os.getenv('METRICS_PORT') or os.getenv('PORT') or 0)  # 0 disables /metrics and /healthz
+METRICS_HOST = "0.0.0.0"
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)  # seconds
+LOOP_LAG_INTERVAL = 0.1  # seconds between event-loop heartbeats
+LOOP_STALL_THRESHOLD = 0.25  # seconds of lag logged as a stall, with the blocking stack
+LOOP_LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+RATE_LIMIT_RESERVE = 1  # requests per bucket kept back from background traffic
 TIMEOUT = 30.0
+ESTIMATE_SAMPLE_SIZE = 100  # messages sampled at each end of the range
+PIPELINE_QUEUE_SIZE = 1000  # messages buffered between export pipeline stages
+HISTORY_PAGE_SIZE = 100  # Discord's maximum messages per history request
+HISTORY_PREFETCH_DEPTH = 2  # history pages fetched ahead of the export loop
+HISTORY_FETCH_CONCURRENCY = 4  # concurrent history cursors for large ranges
+PARTITION_MIN_MESSAGES = 20000  # estimated size before history is partitioned
+PARTITION_TARGET_MESSAGES = 5000  # estimated messages per partition
+PARTITION_BUFFER_PAGES = 50  # pages buffered per partition while waiting to merge
+MESSAGE_STORE_ENABLED = True
+MESSAGE_STORE_FILE = "messages.db"
+STORE_RECHECK_HOURS = 24  # recent history re-fetched on sync to pick up edits
+STORE_READ_BATCH = 1000  # rows read from the local store per query
+ROLE_FILTER_DEPARTED_POLICY = "exclude"  # "exclude" or "include" authors who left the guild
+CSV_WRITE_BUFFER = 1024 * 1024  # bytes buffered per CSV part file
 DIR_PERMISSION = 0o700
 FILE_PERMISSION = 0o600
 
@@ -167,29 +212,44 @@ if RAILWAY_MODE:
 # 4. REST OF IMPORTS
 import discord
 import os
-import pandas as pd
 from dotenv import load_dotenv
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import math
 import asyncio
 import zipfile
+import gzip
+import tempfile
 import io
+from collections import deque
 import concurrent.futures
 import functools
+import operator
+import itertools
+import random
+import bisect
+import threading
+import contextvars
+from contextlib import asynccontextmanager
 import traceback
 import psutil
 import time
-from typing import Optional, Tuple, List, Literal, Any, Dict
+from typing import Optional, Tuple, List, Literal, Any, Dict, NamedTuple, Callable
 import aiohttp
+from aiohttp import web
 import logging
+import excel_parts
+from excel_parts import ColumnarChunk, write_excel_part, EXCEL_CELL_OVERHEAD
 from discord import app_commands
 from discord.ext import commands
 import signal
+import multiprocessing
 import atexit
 from logging.handlers import RotatingFileHandler
 import json
 import glob
+import sqlite3
+import csv
 from functools import wraps
 
 # Add after imports
@@ -385,9 +445,6 @@ def cleanup_old_logs():
 # Initialize data directory first
 data_dir = DataDirectory()
 
-# Clean up old logs at startup
-cleanup_old_logs()
-
 # 7. VERSION
 VERSION = VERSION  # Using imported VERSION instead of config.VERSION
 
@@ -420,15 +477,115 @@ for handler in logger.handlers[:]:
 
 # 9. CLASS DEFINITIONS
 class ProgressTracker:
-    def __init__(self, message, total=None):
+    """Export progress counters, rendered into the progress message by a ticker task"""
+    STAGES = ('fetch', 'build', 'write', 'upload')
+
+    def __init__(self, message, total=None, update_interval=PROGRESS_UPDATE_INTERVAL):
         self.message = message
         self.count = 0
         self.filtered_count = 0
         self.total = total
-        self.last_update = time.time()
-        self.update_interval = 2
+        self.total_is_estimate = False  # True while total is extrapolated from samples
+        self.update_interval = update_interval
+        self.interval = update_interval  # current cadence, stretched while rate limited
         self.batch_size = 100
         self.last_message = None  # Track last message to prevent duplicates
+        self.stage_times = dict.fromkeys(self.STAGES, 0.0)
+        self.rate = None  # smoothed messages per second
+        self._sampled_count = 0
+        self._sampled_at = time.monotonic()
+        self.started_at = self._sampled_at
+        self._ticker = None
+
+    def start(self):
+        """Start editing the progress message in the background"""
+        self.started_at = self._sampled_at = time.monotonic()
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._tick())
+
+    def stop(self):
+        if self._ticker:
+            self._ticker.cancel()
+            self._ticker = None
+
+    async def _tick(self):
+        rate_limited = rate_limiter.rate_limited
+        while True:
+            await asyncio.sleep(self.interval)
+            if rate_limiter.rate_limited > rate_limited:
+                rate_limited = rate_limiter.rate_limited
+                self.interval = min(self.interval * 2, PROGRESS_MAX_INTERVAL)
+            else:
+                self.interval = self.update_interval
+            self._sample_rate()
+            await self.update()
+
+    def _sample_rate(self):
+        now = time.monotonic()
+        elapsed = now - self._sampled_at
+        if elapsed <= 0:
+            return
+        current = (self.count - self._sampled_count) / elapsed
+        if self.rate is None:
+            self.rate = current
+        else:
+            self.rate = PROGRESS_RATE_SMOOTHING * current + (1 - PROGRESS_RATE_SMOOTHING) * self.rate
+        self._sampled_count = self.count
+        self._sampled_at = now
+
+    @property
+    def current_rate(self) -> Optional[float]:
+        """Smoothed messages/sec, or the average so far before the first tick"""
+        if self.rate is not None:
+            return self.rate
+        elapsed = time.monotonic() - self.started_at
+        return self.count / elapsed if self.count and elapsed > 0 else None
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left at the current rate, None until a rate and total are known"""
+        rate = self.current_rate
+        if not rate or not self.total or self.count >= self.total:
+            return None
+        return (self.total - self.count) / rate
+
+    @staticmethod
+    def _format_seconds(seconds: float) -> str:
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+    def _generate_stats_line(self) -> str:
+        """Rate, ETA and per-stage seconds, e.g. for the second line of the progress message"""
+        parts = []
+        rate = self.current_rate
+        if rate is not None:
+            parts.append(f"{rate:,.0f} msg/s")
+        if self.eta is not None:
+            parts.append(f"ETA {'~' if self.total_is_estimate else ''}{self._format_seconds(self.eta)}")
+        parts.append(" · ".join(f"{stage} {self.stage_times[stage]:.1f}s" for stage in self.STAGES))
+        return " | ".join(parts)
+
+    async def update(self, force=False):
+        """Edit the progress message if its text changed
+
+        Without `force` the edit is skipped while the rate limiter wants the
+        budget for history pages and uploads; the next tick carries newer numbers.
+        """
+        try:
+            message = self._generate_progress_message()
+            if message == self.last_message:  # Only update if message changed
+                return
+            key = ('edit', self.message.id)
+            if not force and rate_limiter.delay(key, RateLimiter.BACKGROUND):
+                return
+            async with rate_limiter.request(key, RateLimiter.BACKGROUND):
+                await self.message.edit(content=message)
+            self.last_message = message
+        except discord.errors.HTTPException as e:
+            logger.error(f"Failed to update progress: {e}")
+        except Exception as e:
+            logger.error(f"Progress update error: {e}")
 
     def _generate_progress_bar(self, progress):
         length = 20
@@ -436,45 +593,20 @@ class ProgressTracker:
         bar = '█' * filled + '░' * (length - filled)
         return f'[{bar}]'
 
-    async def update(self, force=False, filtered=False, batch_mode=False):
-        """
-        Update progress
-        batch_mode: True if updating for a batch of messages (don't increment count)
-        """
-        try:
-            if not batch_mode:
-                self.count += 1
-                if filtered:
-                    self.filtered_count += 1
-            
-            current_time = time.time()
-            should_update = force or (
-                self.count % self.batch_size == 0 and 
-                current_time - self.last_update >= self.update_interval
-            )
-            
-            if should_update:
-                self.last_update = current_time
-                try:
-                    message = self._generate_progress_message()
-                    if message != self.last_message:  # Only update if message changed
-                        await self.message.edit(content=message)
-                        self.last_message = message
-                except discord.errors.HTTPException as e:
-                    logger.error(f"Failed to update progress: {e}")
-        except Exception as e:
-            logger.error(f"Progress update error: {e}")
-
     def _generate_progress_message(self):
         """Generate progress message string"""
         if self.total and self.total > 0:
             progress = min((self.count / self.total) * 100, 100)
             bar = self._generate_progress_bar(progress)
             filtered_info = f" ({self.filtered_count:,} matched)" if self.filtered_count else ""
-            return f"Progress: {self.count:,}/{self.total:,} messages {bar} ({progress:.1f}%){filtered_info}"
+            approx = "~" if self.total_is_estimate else ""
+            return (
+                f"Progress: {self.count:,}/{approx}{self.total:,} messages {bar} ({progress:.1f}%){filtered_info}\n"
+                f"{self._generate_stats_line()}"
+            )
         else:
             filtered_info = f" ({self.filtered_count:,} matched)" if self.filtered_count else ""
-            return f"Progress: {self.count:,} messages processed...{filtered_info}"
+            return f"Progress: {self.count:,} messages processed...{filtered_info}\n{self._generate_stats_line()}"
 
 class ExporterBot(discord.Client):
     def __init__(self):
@@ -483,25 +615,25 @@ class ExporterBot(discord.Client):
         intents.message_content = True
         intents.guilds = True
         intents.members = True
-        super().__init__(intents=intents)
+        # Every response passes its rate-limit headers to the shared limiter
+        super().__init__(intents=intents, http_trace=rate_limiter.trace_config())
         self.tree = app_commands.CommandTree(self)
-        self._last_export_time = 0
-        self._export_cooldown = EXPORT_COOLDOWN  # Using imported EXPORT_COOLDOWN
         self._session = None
-        self._active_exports = set()
+        self.scheduler = ExportScheduler()
+        self._exports_resumed = False
         self._start_time = time.time()
+        self.metrics_server = MetricsServer(self) if METRICS_PORT else None
 
     async def setup_hook(self):
         self._session = aiohttp.ClientSession()
+        loop_monitor.start()
+        if self.metrics_server:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"Metrics server failed to start on port {METRICS_PORT}: {e}")
         await self.tree.sync()
 
-    async def can_export(self):
-        current_time = time.time()
-        if current_time - self._last_export_time < self._export_cooldown:
-            return False
-        self._last_export_time = current_time
-        return True
-
     async def check_memory(self):
         """Check available memory and warn if low"""
         available_memory = psutil.virtual_memory().available / (1024 * 1024)
@@ -510,10 +642,8 @@ class ExporterBot(discord.Client):
     async def cleanup(self):
         """Async cleanup tasks"""
         try:
-            # Cancel active exports
-            for task in self._active_exports:
-                task.cancel()
-            self._active_exports.clear()
+            # Stop exports; their checkpoints are resumed on the next start
+            self.scheduler.suspend_all()
 
             # Cancel other tasks
             tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
@@ -523,6 +653,10 @@ class ExporterBot(discord.Client):
             # Clear memory
             clear_memory()
             
+            loop_monitor.stop()
+            if self.metrics_server:
+                await self.metrics_server.stop()
+
             # Close session
             if self._session:
                 await self._session.close()
@@ -538,36 +672,511 @@ class ExporterBot(discord.Client):
         finally:
             await super().close()
 
+class SafeBuffer:
+    """Context manager for safe buffer handling"""
+    def __init__(self):
+        self.buffers = []
+
+    def create_buffer(self, buffer_type=io.BytesIO):
+        buffer = buffer_type()
+        self.buffers.append(buffer)
+        return buffer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for buffer in self.buffers:
+            try:
+                buffer.close()
+            except:
+                pass
+
+class CompressingSink(io.RawIOBase):
+    """Raw stream that gzips or zips written blocks on a worker thread
+
+    zlib releases the GIL while deflating, so compression overlaps with row
+    building on the event loop. At most COMPRESSION_QUEUE_BLOCKS blocks wait
+    for the compressor before writes start waiting for it. The compressed
+    stream goes to ``output``, which is left open.
+    """
+    def __init__(self, output, member: str, compression: str):
+        self._raw = output
+        self._archive = None
+        if compression == 'zip':
+            self._archive = zipfile.ZipFile(self._raw, 'w', zipfile.ZIP_DEFLATED)
+            self._out = self._archive.open(member, 'w', force_zip64=True)
+        else:
+            self._out = gzip.GzipFile(filename=member, mode='wb', fileobj=self._raw)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='compress')
+        self._pending = deque()
+        self.received = 0
+        self.consumed = 0
+        self.compressed = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.received
+
+    def _compress(self, block: bytes):
+        self._out.write(block)
+        self.consumed += len(block)
+        self.compressed = self._raw.tell()
+
+    def _finish(self):
+        self._out.close()
+        if self._archive:
+            self._archive.close()
+
+    def write(self, data) -> int:
+        while self._pending and self._pending[0].done():
+            self._pending.popleft().result()
+        if len(self._pending) >= COMPRESSION_QUEUE_BLOCKS:
+            self._pending.popleft().result()
+        self._pending.append(self._executor.submit(self._compress, bytes(data)))
+        self.received += len(data)
+        return len(data)
+
+    def projected_size(self, raw_bytes: int) -> int:
+        """Compressed size once ``raw_bytes`` have gone through the compressor"""
+        ratio = self.compressed / self.consumed if self.consumed else COMPRESSION_SIZE_RATIO
+        return self.compressed + int((raw_bytes - self.consumed) * ratio)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._pending.append(self._executor.submit(self._finish))
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._executor.shutdown(wait=True)
+            super().close()
+
+def spooled_part_buffer():
+    """Binary buffer for one part: in memory up to PART_SPOOL_MAX_MEMORY, then a temp file"""
+    return tempfile.SpooledTemporaryFile(max_size=PART_SPOOL_MAX_MEMORY, mode='w+b', dir=data_dir.temp_dir)
+
+class CsvPartWriter:
+    """Stream the rows of one CSV part into a spooled buffer, optionally compressed"""
+    extension = 'csv'
+    size_ratio = 1.0
+
+    def __init__(self, filename: str, columns: List[str], buffers: SafeBuffer, compression: Optional[str] = None):
+        self.row_count = 0
+        self.file_size = None
+        self.compression = compression
+        self.buffer = buffers.create_buffer(spooled_part_buffer)
+        self._sink = None
+        if compression:
+            self.filename = filename + '.gz' if compression == 'gzip' else os.path.splitext(filename)[0] + '.zip'
+            self._sink = CompressingSink(self.buffer, filename, compression)
+            buffered = io.BufferedWriter(self._sink, buffer_size=CSV_WRITE_BUFFER)
+            self._file = io.TextIOWrapper(buffered, encoding='utf-8-sig', newline='')
+        else:
+            self.filename = filename
+            self._file = io.TextIOWrapper(self.buffer, encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._writer.writerow(columns)
+
+    @property
+    def bytes_written(self) -> int:
+        """Bytes the part file will take, give or take the text layer's small pending buffer"""
+        if self.file_size is not None:
+            return self.file_size
+        if self._sink:
+            return self._sink.projected_size(self._file.buffer.tell())
+        return self.buffer.tell()
+
+    def write_row(self, row: tuple):
+        self._writer.writerow(row)
+        self.row_count += 1
+
+    def close(self):
+        if self._sink:
+            self._file.close()
+        else:
+            # Detach so closing the text layer doesn't close the buffer
+            self._file.flush()
+            self._file.detach()
+        self.file_size = self.buffer.tell()
+
+    async def finish(self):
+        """Close the part on the serialization thread pool"""
+        await asyncio.get_running_loop().run_in_executor(serialization_executor, self.close)
+
+    def output(self):
+        """Return the finished part, rewound for (re)uploading"""
+        self.buffer.seek(0)
+        return self.buffer
+
+    def read_rows(self) -> List[list]:
+        """Read the finished part's rows back, header excluded, to split it"""
+        stream = self.output()
+        if self.compression == 'zip':
+            archive = zipfile.ZipFile(stream)
+            stream = archive.open(archive.namelist()[0])
+        elif self.compression == 'gzip':
+            stream = gzip.GzipFile(fileobj=stream, mode='rb')
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        try:
+            return list(csv.reader(text))[1:]
+        finally:
+            # Leave the part buffer open for discard()
+            text.detach()
+
+    def discard(self):
+        self.buffer.close()
+
+class ExcelPartWriter(excel_parts.ExcelPartWriter):
+    """Stream the rows of one Excel part into a spooled buffer, saved on the serialization thread pool"""
+    size_ratio = EXCEL_SIZE_RATIO
+
+    def __init__(self, filename: str, columns: List[str], buffers: SafeBuffer):
+        super().__init__(filename, columns, buffers.create_buffer(spooled_part_buffer))
+
+    async def finish(self):
+        """Close the part on the serialization thread pool"""
+        await asyncio.get_running_loop().run_in_executor(serialization_executor, self.close)
+
+class PooledExcelPartWriter:
+    """Buffer one Excel part in columns and build the workbook in a worker process
+
+    Only the compact column buffers cross the process boundary, and only the
+    file size comes back, so workbook generation uses every core instead of
+    holding the GIL of the bot process. The worker writes the part to the temp
+    dir, since a spooled buffer can't be shared between processes.
+    """
+    extension = 'xlsx'
+    size_ratio = EXCEL_SIZE_RATIO
+
+    def __init__(self, filename: str, columns: List[str], buffers: Optional[SafeBuffer] = None):
+        self.filename = filename
+        self.path = data_dir.get_temp_file(filename)
+        self.row_count = 0
+        self.bytes_written = 0  # raw cell bytes; the saved file is compressed
+        self.file_size = None
+        self._chunk = ColumnarChunk(columns)
+        self._output = None
+
+    def write_row(self, row: tuple):
+        self._chunk.append(row)
+        self.row_count += 1
+        self.bytes_written += sum(len(str(value)) for value in row) + EXCEL_CELL_OVERHEAD * len(row)
+
+    async def finish(self):
+        chunk, self._chunk = self._chunk, None
+        loop = asyncio.get_running_loop()
+        self.file_size = await loop.run_in_executor(get_serialization_pool(), write_excel_part, self.path, chunk)
+
+    def output(self):
+        """Return the finished part, rewound for (re)uploading"""
+        if self._output is None:
+            self._output = open(self.path, 'rb')
+        self._output.seek(0)
+        return self._output
+
+    read_rows = excel_parts.ExcelPartWriter.read_rows
+
+    def discard(self):
+        if self._output:
+            self._output.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
 class MessageChunker:
     """Helper for managing message chunks"""
-    def __init__(self, chunk_size):
+    def __init__(self, chunk_size, columns, channel_name, is_csv, original_message, buffers, size_limit=None,
+                 compression=None, on_part_delivered=None, on_part_failed=None, first_part=1, stage_times=None):
         self.chunk_size = chunk_size
-        self.current_chunk = []
-        self.chunk_number = 0
+        self.columns = columns
+        self.channel_name = channel_name
+        self.is_csv = is_csv
+        self.original_message = original_message
+        self.size_limit = size_limit
+        self.compression = compression
+        self.buffers = buffers  # owns the spooled part buffers
+        self.on_part_delivered = on_part_delivered  # callback(number, part, last_row) after a successful upload
+        self.on_part_failed = on_part_failed  # callback(number, part) when a part can't be finished or sent
+        self.current_part = None
+        self.last_row = None  # last row written to the current part
+        self.chunk_number = first_part - 1
+        self.stage_times = stage_times if stage_times is not None else dict.fromkeys(ProgressTracker.STAGES, 0.0)
+        if is_csv:
+            self.writer_class = CsvPartWriter
+        elif SERIALIZATION_BACKEND == "process":
+            self.writer_class = PooledExcelPartWriter
+        else:
+            self.writer_class = ExcelPartWriter
+        self.size_ratio = self.writer_class.size_ratio
+        self.upload_queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+        self._uploader = None
+        self._pending = None  # part being handed to the uploader, for abort
+        self.queue_wait = 0.0  # seconds spent waiting for room in the upload queue
+
+    def _open_part(self):
+        """Start the next part file"""
+        self.chunk_number += 1
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return self._new_part(f"{self.channel_name}_{timestamp}_part{self.chunk_number}")
+
+    def _new_part(self, name: str):
+        filename = f"{name}.{self.writer_class.extension}"
+        if self.compression:
+            return self.writer_class(filename, self.columns, self.buffers, self.compression)
+        return self.writer_class(filename, self.columns, self.buffers)
+
+    def _part_full(self, part) -> bool:
+        if part.row_count >= self.chunk_size:
+            return True
+        return bool(self.size_limit) and part.bytes_written * self.size_ratio >= self.size_limit
 
-    async def add_message(self, message_data, channel_name, is_csv, original_message):
+    async def add_message(self, message_data):
         if message_data:
-            self.current_chunk.append(message_data)
+            if self.current_part is None:
+                self.current_part = self._open_part()
+            self.current_part.write_row(message_data)
+            self.last_row = message_data
             
-        if len(self.current_chunk) >= self.chunk_size:
-            await self._save_chunk(channel_name, is_csv, original_message)
-
-    async def _save_chunk(self, channel_name, is_csv, original_message):
-        if self.current_chunk:
-            self.chunk_number += 1
-            await save_and_send_messages(
-                self.current_chunk,
-                channel_name,
-                f"part{self.chunk_number}",
-                is_csv,
-                self.chunk_size,
-                original_message
-            )
-            self.current_chunk = []
+        if self.current_part and self._part_full(self.current_part):
+            await self._save_chunk()
+
+    async def _save_chunk(self):
+        if self.current_part and self.current_part.row_count:
+            part, self.current_part = self.current_part, None
+            if self._uploader is None:
+                self._uploader = asyncio.create_task(self._upload_parts())
+            self._pending = (part, self._finish_part(part), self.last_row, self.chunk_number)
+            await self._put(self._pending)
+
+    def _finish_part(self, part) -> asyncio.Future:
+        """Start saving a part in the background, updating the size ratio once it is saved"""
+        closing = asyncio.ensure_future(part.finish())
+
+        def measure(done):
+            if not done.cancelled() and done.exception() is None and part.file_size and part.bytes_written:
+                self.size_ratio = part.file_size / part.bytes_written
+
+        closing.add_done_callback(measure)
+        return closing
 
-    async def finish(self, channel_name, is_csv, original_message):
-        if self.current_chunk:
-            await self._save_chunk(channel_name, is_csv, original_message)
+    async def _put(self, item):
+        """Queue an item for the uploader, raising its error if it has stopped
+
+        A failed uploader never drains the queue again, so a plain put would
+        wait forever once UPLOAD_QUEUE_SIZE parts are queued.
+        """
+        put = asyncio.ensure_future(self.upload_queue.put(item))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait((put, self._uploader), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.queue_wait += time.perf_counter() - started
+            if put.done():
+                self._pending = None  # queued, abort finds it there
+            else:
+                put.cancel()
+        if self._uploader.done():
+            self._uploader.result()
+
+    async def _upload_parts(self):
+        while True:
+            item = await self.upload_queue.get()
+            if item is None:
+                break
+            part, closing, last_row, number = item
+            started = time.perf_counter()
+            try:
+                await self._deliver(part, closing)
+            except Exception:
+                if self.on_part_failed:
+                    self.on_part_failed(number, part)
+                raise
+            elapsed = time.perf_counter() - started
+            self.stage_times['upload'] += elapsed
+            metrics.part_uploaded(part, elapsed)
+            if self.on_part_delivered:
+                self.on_part_delivered(number, part, last_row)
+
+    async def _deliver(self, part, closing):
+        """Send a part, splitting it in halves while it comes out over the upload limit
+
+        The size projection is only an estimate, so a part can end up too big
+        once it is saved. Its rows are read back and written to two new parts
+        (``part3a``, ``part3b``) rather than dropped.
+        """
+        await asyncio.wait((closing,))
+        finished = not closing.cancelled() and closing.exception() is None
+        if not (finished and self.size_limit and part.file_size > self.size_limit / UPLOAD_SIZE_MARGIN
+                and part.row_count > 1):
+            # save_and_send_messages reports a failed finish as well as a failed upload
+            await save_and_send_messages(part, closing, self.original_message, self.size_limit)
+            return
+
+        logger.info(f"Splitting export part {part.filename} ({part.file_size / 1024 / 1024:.1f} MB) in two")
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(serialization_executor, part.read_rows)
+        finally:
+            part.discard()
+        name = part.filename.split('.', 1)[0]
+        half = len(rows) // 2
+        for suffix, subset in (('a', rows[:half]), ('b', rows[half:])):
+            half_part = self._new_part(name + suffix)
+            for row in subset:
+                half_part.write_row(row)
+            await self._deliver(half_part, self._finish_part(half_part))
+
+    async def finish(self):
+        if self.current_part:
+            await self._save_chunk()
+        if self._uploader:
+            await self._put(None)
+            await self._uploader
+
+    async def abort(self):
+        """Stop uploading and delete part files that were not sent"""
+        if self._uploader:
+            self._uploader.cancel()
+            await asyncio.gather(self._uploader, return_exceptions=True)
+        pending = []
+        if self._pending:
+            pending.append(self._pending)
+        self._pending = None
+        if self.current_part:
+            pending.append((self.current_part, asyncio.ensure_future(self.current_part.finish()), None, None))
+            self.current_part = None
+        while not self.upload_queue.empty():
+            item = self.upload_queue.get_nowait()
+            if item is not None:
+                pending.append(item)
+        for part, closing, *_ in pending:
+            try:
+                await closing
+                part.discard()
+            except Exception as e:
+                logger.error(f"Error discarding export part {part.filename}: {e}")
+
+class ExportPipeline:
+    """Bounded fetch -> filter/row-build -> chunk pipeline
+
+    Each stage runs in its own task and hands work to the next one through a
+    bounded queue, so memory stays proportional to the queue sizes plus one
+    chunk, and finished parts are uploaded while history is still being fetched.
+    """
+    _DONE = object()  # end-of-stream marker passed down the queues
+
+    def __init__(self, source, row_builder, chunker, queue_size=PIPELINE_QUEUE_SIZE, stage_times=None):
+        self.source = source  # async iterator of discord messages
+        self.row_builder = row_builder  # callable: record -> row tuple or None
+        self.chunker = chunker
+        self.message_queue = asyncio.Queue(maxsize=queue_size)
+        self.row_queue = asyncio.Queue(maxsize=queue_size)
+        self.matched = 0
+        # Seconds each stage spends on its own work: waiting for history, building rows, writing parts
+        self.stage_times = stage_times if stage_times is not None else dict.fromkeys(ProgressTracker.STAGES, 0.0)
+
+    async def _fetch_stage(self):
+        clock = time.perf_counter
+        source = self.source.__aiter__()
+        while True:
+            started = clock()
+            try:
+                message = await source.__anext__()
+            except StopAsyncIteration:
+                break
+            self.stage_times['fetch'] += clock() - started
+            await self.message_queue.put(message)
+        await self.message_queue.put(self._DONE)
+
+    async def _row_stage(self):
+        clock = time.perf_counter
+        while True:
+            message = await self.message_queue.get()
+            if message is self._DONE:
+                break
+            started = clock()
+            row = self.row_builder(message)
+            self.stage_times['build'] += clock() - started
+            if row is not None:
+                await self.row_queue.put(row)
+        await self.row_queue.put(self._DONE)
+
+    async def _write_stage(self):
+        clock = time.perf_counter
+        while True:
+            row = await self.row_queue.get()
+            if row is self._DONE:
+                break
+            started = clock()
+
+            # Check memory periodically
+            is_ok, warning = memory_monitor.check()
+            if not is_ok:
+                raise MemoryError(warning)
+            elif warning:
+                logger.warning(warning)
+
+            self.matched += 1
+            # Waiting for a full upload queue is upload time, not write time
+            waited = self.chunker.queue_wait
+            await self.chunker.add_message(row)
+            self.stage_times['write'] += clock() - started - (self.chunker.queue_wait - waited)
+
+        # Save remaining messages
+        await self.chunker.finish()
+
+    async def run(self) -> int:
+        """Run all stages to completion and return the number of rows written"""
+        tasks = [
+            asyncio.create_task(self._fetch_stage()),
+            asyncio.create_task(self._row_stage()),
+            asyncio.create_task(self._write_stage()),
+        ]
+        failed = True
+        try:
+            await asyncio.gather(*tasks)
+            failed = False
+        finally:
+            # A failing stage must not leave the others blocked on a full queue
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if failed:
+                await self.chunker.abort()
+        return self.matched
+
+class RoleMembershipIndex:
+    """Member IDs per role, cached per guild for the export role filter
+
+    Built from role.members the first time a role is filtered on and dropped
+    when member roles or the role itself change, so the role check is one
+    set lookup per message.
+    """
+    def __init__(self):
+        self._guilds = {}  # guild_id -> {role_id: frozenset of member IDs}
+
+    def get(self, role: discord.Role) -> frozenset:
+        roles = self._guilds.setdefault(role.guild.id, {})
+        members = roles.get(role.id)
+        if members is None:
+            members = frozenset(member.id for member in role.members)
+            roles[role.id] = members
+        return members
+
+    def invalidate(self, guild_id: int, role_ids=None):
+        """Drop cached roles of a guild, or all of them if role_ids is None"""
+        if role_ids is None:
+            self._guilds.pop(guild_id, None)
+            return
+        roles = self._guilds.get(guild_id)
+        if roles:
+            for role_id in role_ids:
+                roles.pop(role_id, None)
 
 class ExportCleanup:
     """Context manager for export cleanup"""
@@ -587,12 +1196,848 @@ class ExportCleanup:
             # Force garbage collection
             clear_memory()
             
-            # Remove task from active exports
-            self.client._active_exports.discard(self.task)
-            
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
 
+class StateFileManager:
+    """Manage bot state file with proper permissions and backup"""
+    def __init__(self, filename: str, backup_count: int = 3):
+        self.filename = filename
+        self.backup_count = backup_count
+        self.backup_suffix = '.backup'
+        self._ensure_directory()
+
+    def _ensure_directory(self):
+        """Ensure state directory exists with proper permissions"""
+        directory = os.path.dirname(self.filename) or '.'
+        if not os.path.exists(directory):
+            os.makedirs(directory, mode=DIR_PERMISSION)  # Use config value
+        else:
+            os.chmod(directory, DIR_PERMISSION)  # Use config value
+
+    def _create_backup(self):
+        """Create backup of state file"""
+        if os.path.exists(self.filename):
+            # Rotate backups
+            for i in range(self.backup_count - 1, 0, -1):
+                old = f"{self.filename}{self.backup_suffix}.{i}"
+                new = f"{self.filename}{self.backup_suffix}.{i+1}"
+                if os.path.exists(old):
+                    if os.path.exists(new):
+                        os.remove(new)
+                    os.rename(old, new)
+            
+            # Create new backup
+            backup = f"{self.filename}{self.backup_suffix}.1"
+            if os.path.exists(backup):
+                os.remove(backup)
+            import shutil
+            shutil.copy2(self.filename, backup)
+
+    def save(self, data: dict):
+        """Save data to state file with backup"""
+        try:
+            self._create_backup()
+            temp_file = f"{self.filename}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(temp_file, self.filename)  # Atomic write
+            os.chmod(self.filename, FILE_PERMISSION)  # Use config value
+            return True
+        except Exception as e:
+            logger.error(f"Error saving state file: {e}")
+            return False
+
+    def load(self) -> Optional[dict]:
+        """Load data from state file or latest backup"""
+        files_to_try = [
+            self.filename,
+            *[f"{self.filename}{self.backup_suffix}.{i}" 
+              for i in range(1, self.backup_count + 1)]
+        ]
+        for file in files_to_try:
+            try:
+                if os.path.exists(file):
+                    with open(file, 'r') as f:
+                        data = json.load(f)
+                    if file != self.filename:
+                        logger.warning(f"Loaded state from backup: {file}")
+                    return data
+            except Exception as e:
+                logger.error(f"Error loading state from {file}: {e}")
+        
+        return None
+
+class ExportJob:
+    """One /export request and its live state, as seen by the scheduler and /queue"""
+    _ids = itertools.count(1)
+
+    def __init__(self, guild_id: int, user_id: int, user_name: str, channel, message, params: dict,
+                 role=None, category=None, interaction: Optional[discord.Interaction] = None,
+                 key: Optional[str] = None, priority: int = 0):
+        self.id = next(self._ids)
+        self.key = key or str(message.id)  # stable across restarts, names the checkpoint
+        self.interaction = interaction  # None for jobs resumed after a restart
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.user_name = user_name
+        self.channel = channel
+        self.channel_name = channel.name
+        self.role = role
+        self.category = category
+        self.params = params  # JSON-safe export options plus resume position, see to_checkpoint
+        self.message = message  # progress message shown to the user
+        self.priority = priority  # lower runs first
+        self.estimated_count = None
+        self.cost = 0  # estimated peak memory, see AdmissionController
+        self.state = 'queued'  # queued -> running -> done | failed | cancelled | interrupted
+        self.runner = None  # coroutine function doing the export
+        self.task = None
+        self.progress = None  # ProgressTracker once the export has started
+        self.matched = 0
+        self.error = None
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.announced_position = None
+        self.announcement = None  # pending queue message edit, see ExportScheduler._announce
+        self.queue_reason = ""  # why admission made the job wait, shown with its position
+        self.delivery_failed = False  # a part was lost, see part_failed
+
+    @property
+    def format(self) -> str:
+        return self.params['format']
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds spent running (or waiting, while queued)"""
+        if self.started_at is None:
+            return time.time() - self.queued_at
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def processed(self) -> int:
+        return self.progress.count if self.progress else 0
+
+    @property
+    def throughput(self) -> float:
+        """Messages processed per second since the job started"""
+        elapsed = self.elapsed if self.started_at else 0
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def describe(self) -> str:
+        if self.state == 'queued':
+            return f"{self.user_name} - #{self.channel_name} ({self.format}) - queued for {int(self.elapsed)}s"
+        return (
+            f"{self.user_name} - #{self.channel_name} ({self.format}) - {self.state} for {int(self.elapsed)}s, "
+            f"{self.processed:,} messages ({self.throughput:,.0f}/s)"
+        )
+
+    async def notify(self, content: str):
+        """Send a follow-up to the user who started the export"""
+        if self.interaction:
+            await self.interaction.followup.send(content)
+        else:
+            await self.message.channel.send(content)
+
+    @property
+    def resumable(self) -> bool:
+        """Whether the checkpoint outlives this run, to be resumed on the next start"""
+        if self.state == 'interrupted':
+            return True
+        return (self.state == 'failed' and self.delivery_failed
+                and self.params.get('resume_attempts', 0) < EXPORT_RESUME_ATTEMPTS)
+
+    def part_delivered(self, number: int, part, last_row: tuple):
+        """Advance the checkpoint past a part that reached the channel
+
+        Rows arrive newest first, so everything older than the part's last
+        message is still to do. The checkpoint only moves across consecutive
+        parts; resuming after a later part would skip the rows of a lost one.
+        """
+        if number != self.params.get('parts_delivered', 0) + 1:
+            self.delivery_failed = True
+            return
+        self.params['resume_before_id'] = int(last_row[0])
+        self.params['parts_delivered'] = self.params.get('parts_delivered', 0) + 1
+        self.params['rows_delivered'] = self.params.get('rows_delivered', 0) + part.row_count
+        export_checkpoints.save(self)
+
+    def part_failed(self, number: int, part):
+        self.delivery_failed = True
+
+    def to_checkpoint(self) -> dict:
+        return {
+            'key': self.key,
+            'guild_id': self.guild_id,
+            'user_id': self.user_id,
+            'user_name': self.user_name,
+            'channel_id': self.channel.id,
+            'reply_channel_id': self.message.channel.id,
+            'params': self.params,
+            'updated_at': time.time()
+        }
+
+class ExportCheckpoints:
+    """Checkpoints of unfinished exports, persisted with StateFileManager
+
+    A job is written when it is submitted and after every delivered part, and
+    removed once it finishes, fails or is cancelled. Whatever is left after a
+    restart is resumed from its last delivered part.
+    """
+    def __init__(self, filename: str):
+        self.state = StateFileManager(filename)
+        self.jobs = self.state.load() or {}
+
+    def save(self, job: ExportJob):
+        self.jobs[job.key] = job.to_checkpoint()
+        self.state.save(self.jobs)
+
+    def discard(self, key: str):
+        if self.jobs.pop(key, None) is not None:
+            self.state.save(self.jobs)
+
+    def pending(self) -> List[dict]:
+        return list(self.jobs.values())
+
+class ExportScheduler:
+    """Bounded pool of export workers fed by a fair queue"""
+    def __init__(self, max_workers: int = MAX_CONCURRENT_EXPORTS, max_queued: int = MAX_QUEUED_EXPORTS):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.queued = []  # waiting jobs in submission order
+        self.running = []
+        self.history = deque(maxlen=EXPORT_HISTORY_SIZE)  # recently finished jobs
+        self.admission = AdmissionController(self)
+        self.announcements = set()  # pending queue message edits, kept until done
+
+    def _running_for(self, attribute: str, value) -> int:
+        return sum(1 for job in self.running if getattr(job, attribute) == value)
+
+    def _sort_key(self, job: ExportJob):
+        return (
+            job.priority,
+            self._running_for('guild_id', job.guild_id),
+            self._running_for('user_id', job.user_id),
+            job.id
+        )
+
+    def _eligible(self, job: ExportJob) -> bool:
+        return (
+            self._running_for('guild_id', job.guild_id) < MAX_EXPORTS_PER_GUILD and
+            self._running_for('user_id', job.user_id) < MAX_EXPORTS_PER_USER and
+            self.admission.fits(job)
+        )
+
+    def waiting_order(self) -> List[ExportJob]:
+        """Queued jobs in the order they are expected to start"""
+        return sorted(self.queued, key=self._sort_key)
+
+    def position(self, job: ExportJob) -> int:
+        """1-based queue position, or 0 if the job is not waiting"""
+        try:
+            return self.waiting_order().index(job) + 1
+        except ValueError:
+            return 0
+
+    def submit(self, job: ExportJob, runner) -> int:
+        """Queue a job and start it if a slot is free; return its queue position"""
+        if len(self.queued) >= self.max_queued:
+            raise RuntimeError("Export queue is full. Please try again later.")
+        job.runner = runner
+        export_checkpoints.save(job)
+        self.queued.append(job)
+        self._dispatch()
+        return self.position(job)
+
+    def _dispatch(self):
+        while len(self.running) < self.max_workers:
+            candidates = [job for job in self.waiting_order() if self._eligible(job)]
+            if not candidates:
+                break
+            job = candidates[0]
+            # A late queue position edit must not overwrite the export's own progress
+            if job.announcement:
+                job.announcement.cancel()
+            self.admission.job_starting()
+            self.queued.remove(job)
+            self.running.append(job)
+            job.state = 'running'
+            job.started_at = time.time()
+            job.task = asyncio.create_task(self._run(job))
+        self._announce_positions()
+
+    def _announce_positions(self):
+        for position, job in enumerate(self.waiting_order(), 1):
+            if job.announced_position != position:
+                job.announced_position = position
+                content = f"⏳ Export queued at position {position}"
+                if job.queue_reason:
+                    content += f" ({job.queue_reason})"
+                self._announce(job, content)
+
+    def _announce(self, job: ExportJob, content: str):
+        """Edit a queued job's message in the background, replacing any pending edit"""
+        if job.announcement:
+            job.announcement.cancel()
+        job.announcement = asyncio.create_task(self._edit(job, content))
+        self.announcements.add(job.announcement)
+        job.announcement.add_done_callback(self.announcements.discard)
+
+    @staticmethod
+    async def _edit(job: ExportJob, content: str):
+        try:
+            async with rate_limiter.request(('edit', job.message.id), RateLimiter.BACKGROUND):
+                await job.message.edit(content=content)
+        except discord.errors.HTTPException as e:
+            logger.error(f"Failed to update export job {job.id}: {e}")
+
+    async def _run(self, job: ExportJob):
+        try:
+            job.matched = await job.runner() or 0
+            job.state = 'done'
+        except asyncio.CancelledError:
+            if job.state != 'interrupted':
+                job.state = 'cancelled'
+        except Exception as e:
+            job.state = 'failed'
+            job.error = e
+            bot_state.last_error = e
+            logger.error(f"Export error: {e}")
+            content = f"❌ Export failed: {str(e)}"
+            if job.resumable:
+                content += (
+                    f"\n🔄 {job.params.get('parts_delivered', 0)} part(s) were delivered; "
+                    f"the rest will be retried when the bot restarts."
+                )
+            try:
+                await job.notify(content)
+            except Exception as notify_error:
+                logger.error(f"Failed to notify about export job {job.id}: {notify_error}")
+        finally:
+            job.finished_at = time.time()
+            self.running.remove(job)
+            self.history.append(job)
+            if not job.resumable:
+                export_checkpoints.discard(job.key)
+            if job.state in ('done', 'failed'):
+                bot_state.record_export(job.state == 'done', job.processed)
+            metrics.export_finished(job)
+            clear_memory()
+            self._dispatch()
+
+    def cancel(self, job: ExportJob):
+        """Cancel a queued or running job"""
+        if job in self.queued:
+            self.queued.remove(job)
+            job.state = 'cancelled'
+            job.finished_at = time.time()
+            self.history.append(job)
+            export_checkpoints.discard(job.key)
+            self._announce(job, "🛑 Export cancelled")
+            self._announce_positions()
+        elif job in self.running:
+            job.task.cancel()
+
+    def cancel_where(self, predicate=lambda job: True) -> int:
+        """Cancel every queued or running job matching ``predicate``; return how many"""
+        jobs = [job for job in self.running + self.queued if predicate(job)]
+        for job in jobs:
+            self.cancel(job)
+        return len(jobs)
+
+    def cancel_all(self) -> int:
+        return self.cancel_where()
+
+    def suspend_all(self) -> int:
+        """Stop every job for shutdown, keeping checkpoints so they resume on restart"""
+        jobs = self.running + self.queued
+        for job in jobs:
+            job.state = 'interrupted'
+            if job.task:
+                job.task.cancel()
+        self.queued.clear()
+        return len(jobs)
+
+class AdmissionDecision(NamedTuple):
+    """Outcome of AdmissionController.decide for one export request"""
+    action: str  # "admit", "queue", "downgrade" or "reject"
+    format: str
+    part_rows: int
+    cost: int  # estimated peak memory in bytes
+    reason: str = ""
+
+class AdmissionController:
+    """Decide whether an export can start, must wait, or has to be made cheaper"""
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.idle_rss = 0  # bot RSS when the first of the running jobs started
+
+    @staticmethod
+    def estimate_cost(estimated_count: int, columns: List[str], format: str, part_rows: int,
+                      size_limit: int) -> int:
+        row_bytes = sum(COLUMN_SIZE_ESTIMATES.get(name, 20) for name in columns)
+        part_raw = min(estimated_count, part_rows) * row_bytes
+        if format == "csv":
+            part_memory = min(part_raw, size_limit, PART_SPOOL_MAX_MEMORY)
+        elif SERIALIZATION_BACKEND == "process":
+            # The whole part is buffered as Python objects before it is shipped
+            part_rows_cut = min(part_raw, size_limit / EXCEL_SIZE_RATIO) / row_bytes
+            part_memory = int(part_rows_cut * (row_bytes + ADMISSION_CELL_OVERHEAD * len(columns)))
+        else:
+            part_memory = min(int(part_raw * EXCEL_SIZE_RATIO), size_limit, PART_SPOOL_MAX_MEMORY)
+        return ADMISSION_JOB_OVERHEAD + (UPLOAD_QUEUE_SIZE + 2) * part_memory
+
+    @staticmethod
+    def available() -> int:
+        return psutil.virtual_memory().available - ADMISSION_MEMORY_RESERVE
+
+    @staticmethod
+    def rss() -> int:
+        return psutil.Process().memory_info().rss
+
+    def job_starting(self):
+        """Note the bot's idle footprint when a job starts with none running"""
+        if not self.scheduler.running:
+            self.idle_rss = self.rss()
+
+    def headroom(self) -> int:
+        """Memory left for a new job once running jobs reach their estimated peak
+
+        Available memory already excludes what the running jobs hold, measured
+        as the bot's growth since they started, so only the rest of their cost
+        is subtracted.
+        """
+        running = self.scheduler.running
+        if not running:
+            return self.available()
+        in_use = max(0, self.rss() - self.idle_rss)
+        return self.available() - max(0, sum(job.cost for job in running) - in_use)
+
+    def fits(self, job) -> bool:
+        """Whether a queued job can start now; a lone job always may"""
+        return not self.scheduler.running or job.cost <= self.headroom()
+
+    def _plans(self, format: str, part_rows: int):
+        """Cheaper variants of a request, mildest first"""
+        formats = [format, "csv"] if format == "excel" else [format]
+        for plan_format in formats:
+            if plan_format == "csv":
+                part_rows = min(part_rows, MAX_MESSAGES_CSV)
+            yield plan_format, part_rows
+        rows = part_rows // 2
+        while rows >= ADMISSION_MIN_PART_ROWS:
+            yield formats[-1], rows
+            rows //= 2
+
+    def decide(self, estimated_count: int, columns: List[str], format: str, part_rows: int,
+               size_limit: int) -> AdmissionDecision:
+        headroom = self.headroom()
+        capacity = self.available()
+
+        def plan(plan_format, rows, action):
+            cost = self.estimate_cost(estimated_count, columns, plan_format, rows, size_limit)
+            return AdmissionDecision(action, plan_format, rows, cost)
+
+        # With nothing running headroom is all available memory, so an
+        # oversized request is downgraded or rejected rather than queued
+        requested = plan(format, part_rows, "admit")
+        if requested.cost <= headroom:
+            return requested
+
+        cheaper = [plan(f, rows, "downgrade") for f, rows in self._plans(format, part_rows)][1:]
+        fits_now = next((p for p in cheaper if p.cost <= headroom), None)
+
+        # Wait for memory rather than degrade, unless other work is already waiting
+        if requested.cost <= capacity and (fits_now is None or not self.scheduler.queued):
+            return requested._replace(action="queue", reason="waiting for memory held by running exports")
+        if fits_now:
+            return fits_now._replace(reason=self._describe(format, part_rows, fits_now, bool(self.scheduler.running)))
+        fits_later = next((p for p in cheaper if p.cost <= capacity), None)
+        if fits_later:
+            return fits_later._replace(action="queue", reason=self._describe(format, part_rows, fits_later, True))
+        return requested._replace(action="reject", reason="not enough memory for this export")
+
+    @staticmethod
+    def _describe(format: str, part_rows: int, decision: AdmissionDecision, busy: bool) -> str:
+        changes = []
+        if decision.format != format:
+            changes.append(f"exporting as {decision.format.upper()} instead of {format.upper()}")
+        if decision.part_rows != part_rows:
+            changes.append(f"splitting files every {decision.part_rows:,} messages")
+        return ("Bot is busy: " if busy else "Not enough memory: ") + " and ".join(changes)
+
+class RateLimiter:
+    """Process-wide view of Discord's rate limits, shared by every export"""
+    CRITICAL = 0
+    BACKGROUND = 1
+
+    def __init__(self, reserve: int = RATE_LIMIT_RESERVE):
+        self.reserve = reserve
+        self.routes = {}  # route key -> bucket id (bucket hash and major parameter)
+        self.buckets = {}  # bucket id -> {'limit', 'remaining', 'reset_at'}
+        self.global_reset_at = 0.0
+        self.critical_waiting = 0
+        self.requests = 0
+        self.rate_limited = 0  # 429 responses
+        self.rate_limited_by_scope = {}  # user / global / shared -> 429 count
+        self.retries = 0
+        self.wait_time = 0.0  # seconds callers spent waiting for budget
+        self._route = contextvars.ContextVar('rate_limit_route', default=None)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Trace hook for the client's HTTP session, see ExporterBot"""
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(self._on_request_end)
+        return trace
+
+    async def _on_request_end(self, session, context, params: aiohttp.TraceRequestEndParams):
+        self.observe(params.url.path, params.response.status, params.response.headers)
+
+    @staticmethod
+    def _major_parameter(path: str) -> str:
+        """Discord scopes buckets by channel, guild or webhook"""
+        parts = path.strip('/').split('/')
+        for i, part in enumerate(parts[:-1]):
+            if part in ('channels', 'guilds'):
+                return parts[i + 1]
+            if part in ('webhooks', 'interactions'):
+                return '/'.join(parts[i + 1:i + 3])
+        return ''
+
+    def observe(self, path: str, status: int, headers):
+        """Record the budget reported by one response"""
+        now = time.monotonic()
+        self.requests += 1
+        key = self._route.get()
+        bucket_hash = headers.get('X-RateLimit-Bucket')
+        bucket = None
+        if bucket_hash:
+            bucket_id = f"{bucket_hash}:{self._major_parameter(path)}"
+            bucket = self.buckets.setdefault(bucket_id, {'limit': None, 'remaining': None, 'reset_at': 0.0})
+            if key is not None:
+                self.routes[key] = bucket_id
+            try:
+                bucket['limit'] = int(headers.get('X-RateLimit-Limit', bucket['limit'] or 1))
+                bucket['remaining'] = int(headers.get('X-RateLimit-Remaining', bucket['limit']))
+                bucket['reset_at'] = now + float(headers.get('X-RateLimit-Reset-After', 0))
+            except ValueError:
+                pass
+
+        if status == 429:
+            scope = headers.get('X-RateLimit-Scope', 'user')
+            self.rate_limited += 1
+            self.rate_limited_by_scope[scope] = self.rate_limited_by_scope.get(scope, 0) + 1
+            try:
+                retry_after = float(headers.get('Retry-After', 1))
+            except ValueError:
+                retry_after = 1.0
+            if headers.get('X-RateLimit-Global'):
+                self.global_reset_at = now + retry_after
+            elif bucket is not None:
+                bucket['remaining'] = 0
+                bucket['reset_at'] = now + retry_after
+            logger.warning(f"Rate limited ({scope}) on {key or path}, retry after {retry_after:.2f}s")
+
+    def delay(self, key, priority: int = CRITICAL) -> float:
+        """Seconds until a request on `key` may be sent, 0 if it may go now"""
+        now = time.monotonic()
+        wait = max(self.global_reset_at - now, 0.0)
+        bucket = self.buckets.get(self.routes.get(key))
+        if bucket and bucket['remaining'] is not None and bucket['reset_at'] > now:
+            reserve = self.reserve if priority == self.BACKGROUND else 0
+            if bucket['remaining'] <= reserve:
+                wait = max(wait, bucket['reset_at'] - now)
+        if priority == self.BACKGROUND and self.critical_waiting and not wait:
+            wait = RATE_LIMIT_DELAY
+        return wait
+
+    @asynccontextmanager
+    async def request(self, key, priority: int = CRITICAL):
+        """Wait for budget on `key`, then attribute the requests made inside to it"""
+        critical = priority == self.CRITICAL
+        started = time.monotonic()
+        if critical:
+            self.critical_waiting += 1
+        try:
+            while True:
+                wait = self.delay(key, priority)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            if critical:
+                self.critical_waiting -= 1
+        self.wait_time += time.monotonic() - started
+
+        # Spend the budget now so concurrent callers see it before the response lands
+        bucket = self.buckets.get(self.routes.get(key))
+        if bucket and bucket['remaining']:
+            bucket['remaining'] -= 1
+        token = self._route.set(key)
+        try:
+            yield
+        finally:
+            self._route.reset(token)
+
+    def backoff(self, attempt: int, delay: float) -> float:
+        """Jittered exponential delay before retry number `attempt` (from 0)"""
+        self.retries += 1
+        ceiling = min(delay * 2 ** attempt, RETRY_MAX_DELAY)
+        return random.uniform(ceiling / 2, ceiling)
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'rate_limited_by_scope': dict(self.rate_limited_by_scope),
+            'retries': self.retries,
+            'wait_time': self.wait_time,
+            'buckets': len(self.buckets)
+        }
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout"""
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str = "") -> List[str]:
+        lines = []
+        cumulative = 0
+        sep = "," if labels else ""
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float('inf') else repr(float(bound))
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+class Metrics:
+    """Counters and histograms for /metrics
+
+    Recording is a dict or int increment, done per page, part or job, never
+    per message. Gauges (queue depth, rate, RSS, loop lag) are read from the
+    live objects when the endpoint is scraped; LoopLagMonitor fills
+    `loop_lag_seconds` from its heartbeat.
+    """
+    def __init__(self):
+        self.exports = {}  # final job state -> count
+        self.messages_processed = 0
+        self.messages_exported = 0
+        self.parts_uploaded = 0
+        self.bytes_uploaded = 0
+        self.history_page_seconds = Histogram()
+        self.part_upload_seconds = Histogram()
+        self.export_seconds = Histogram()
+        self.stage_seconds = {stage: Histogram() for stage in ProgressTracker.STAGES}
+        self.loop_lag_seconds = Histogram(LOOP_LAG_BUCKETS)
+
+    def part_uploaded(self, part, seconds: float):
+        self.parts_uploaded += 1
+        self.bytes_uploaded += part.file_size or 0
+        self.part_upload_seconds.observe(seconds)
+
+    def export_finished(self, job):
+        self.exports[job.state] = self.exports.get(job.state, 0) + 1
+        self.messages_processed += job.processed
+        if job.state == 'done':
+            self.messages_exported += job.matched
+        if job.started_at is not None:
+            self.export_seconds.observe(job.elapsed)
+        if job.progress:
+            for stage, seconds in job.progress.stage_times.items():
+                self.stage_seconds[stage].observe(seconds)
+
+    def render(self, scheduler, loop_lag: float) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        limits = rate_limiter.stats()
+        running = list(scheduler.running)
+        rate = sum(job.progress.current_rate or 0 for job in running if job.progress)
+
+        metric("exporter_exports_total", "counter", "Finished exports by final state",
+               [(f'state="{state}"', count) for state, count in sorted(self.exports.items())])
+        metric("exporter_messages_processed_total", "counter", "History messages read by finished exports",
+               [("", self.messages_processed)])
+        metric("exporter_messages_exported_total", "counter", "Messages written by completed exports",
+               [("", self.messages_exported)])
+        metric("exporter_parts_uploaded_total", "counter", "Export parts sent to Discord", [("", self.parts_uploaded)])
+        metric("exporter_uploaded_bytes_total", "counter", "Bytes of export parts sent to Discord",
+               [("", self.bytes_uploaded)])
+        metric("exporter_discord_requests_total", "counter", "Discord API responses seen", [("", limits['requests'])])
+        metric("exporter_rate_limited_total", "counter", "Discord 429 responses by scope",
+               [(f'scope="{scope}"', count) for scope, count in sorted(limits['rate_limited_by_scope'].items())]
+               or [('scope="user"', 0)])
+        metric("exporter_retries_total", "counter", "Retried Discord requests", [("", limits['retries'])])
+        metric("exporter_exports_running", "gauge", "Exports currently running", [("", len(running))])
+        metric("exporter_exports_queued", "gauge", "Exports waiting in the queue", [("", len(scheduler.queued))])
+        metric("exporter_messages_per_second", "gauge", "Combined message rate of running exports", [("", rate)])
+        metric("exporter_resident_memory_bytes", "gauge", "Resident set size of the bot process",
+               [("", psutil.Process().memory_info().rss)])
+        metric("exporter_event_loop_lag_last_seconds", "gauge", "Lag of the latest event-loop heartbeat",
+               [("", loop_lag)])
+        metric("exporter_event_loop_stalls_total", "counter",
+               f"Heartbeats late by at least {LOOP_STALL_THRESHOLD}s", [("", loop_monitor.stalls)])
+        metric("exporter_uptime_seconds", "gauge", "Seconds since the bot started",
+               [("", time.time() - bot_state.start_time)])
+
+        for name, help_text, histogram in (
+            ("exporter_history_page_seconds", "Latency of one history page request", self.history_page_seconds),
+            ("exporter_part_upload_seconds", "Time to finish and upload one export part", self.part_upload_seconds),
+            ("exporter_export_seconds", "Run time of finished exports", self.export_seconds),
+            ("exporter_event_loop_lag_seconds", "How late each event-loop heartbeat woke up", self.loop_lag_seconds),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(histogram.render(name))
+
+        lines.append("# HELP exporter_stage_seconds Seconds a finished export spent in each pipeline stage")
+        lines.append("# TYPE exporter_stage_seconds histogram")
+        for stage, histogram in self.stage_seconds.items():
+            lines.extend(histogram.render("exporter_stage_seconds", f'stage="{stage}"'))
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Optional HTTP server for /metrics and /healthz, enabled by METRICS_PORT or PORT
+
+    /healthz answers 200 once the gateway session is ready and 503 otherwise,
+    so Railway health checks and scrapers never need to call Discord.
+    """
+    def __init__(self, bot, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        body = metrics.render(self.bot.scheduler, loop_monitor.last_lag)
+        return web.Response(text=body, content_type="text/plain", charset="utf-8",
+                            headers={"Cache-Control": "no-store"})
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        ready = self.bot.is_ready() and not self.bot.is_closed()
+        body = {
+            'status': 'ok' if ready else 'starting',
+            'uptime': time.time() - bot_state.start_time,
+            'exports_running': len(self.bot.scheduler.running),
+            'exports_queued': len(self.bot.scheduler.queued),
+            'maintenance_mode': bot_state.is_maintenance_mode
+        }
+        return web.json_response(body, status=200 if ready else 503)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.router.add_get('/healthz', self.handle_health)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+class LoopLagMonitor:
+    """Measure event-loop lag and catch whatever is blocking the loop
+
+    A heartbeat task sleeps LOOP_LAG_INTERVAL at a time and records how late
+    it wakes up. A watchdog thread checks the heartbeat from outside the loop;
+    once it is more than LOOP_STALL_THRESHOLD overdue, the loop thread's
+    current stack (the blocking callback) is captured with
+    sys._current_frames() and logged with the stall's duration once the loop
+    recovers.
+    """
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_stall_stack = None  # formatted stack of the most recent stall
+        self._last_beat = time.monotonic()
+        self._captured_beat = None  # heartbeat the pending stack belongs to
+        self._pending_stack = None
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start both halves; call from the event loop"""
+        if self._task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            beat, self._last_beat = self._last_beat, now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            metrics.loop_lag_seconds.observe(lag)
+            if lag >= self.threshold:
+                self.stalls += 1
+                stack = self._pending_stack if self._captured_beat == beat else None
+                self._pending_stack = None
+                if stack:
+                    self.last_stall_stack = stack
+                    logger.warning(f"Event loop blocked for {lag:.3f}s in:\n{stack}")
+                else:
+                    logger.warning(f"Event loop blocked for {lag:.3f}s")
+
+    def _watch(self):
+        """Watchdog thread: grab the loop thread's stack while it is stuck"""
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._last_beat
+            if beat == self._captured_beat:
+                continue
+            if time.monotonic() - beat - self.interval < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            # Drop the event loop's own frames, leaving the blocking callback
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i].filename.endswith(os.path.join('asyncio', 'events.py')):
+                    stack = stack[i + 1:]
+                    break
+            self._pending_stack = "".join(traceback.format_list(stack))
+            self._captured_beat = beat
+
 # 10. UTILITY FUNCTIONS
 def clear_memory():
     """Force garbage collection"""
@@ -631,6 +2076,12 @@ def handle_errors(func):
             logger.error(f"Error in {func.__name__}: {e}")
     return wrapper
 
+def is_transient_error(error: Exception) -> bool:
+    """Errors worth retrying: Discord 5xx and 429 responses, and connection failures"""
+    if isinstance(error, discord.errors.HTTPException):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, aiohttp.ClientError)
+
 def retry_on_error(retries=3, delay=1):
     def decorator(func):
         async def wrapper(*args, **kwargs):
@@ -638,10 +2089,12 @@ def retry_on_error(retries=3, delay=1):
                 try:
                     return await func(*args, **kwargs)
                 except (discord.errors.HTTPException, aiohttp.ClientError) as e:
-                    if attempt == retries - 1:
+                    # Permission and payload errors (403, 413, ...) fail the same way every time
+                    if attempt == retries - 1 or not is_transient_error(e):
                         raise
-                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                    await asyncio.sleep(delay * (attempt + 1))
+                    wait = rate_limiter.backoff(attempt, delay)
+                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}, retrying in {wait:.1f}s")
+                    await asyncio.sleep(wait)
             return None
         return wrapper
     return decorator
@@ -682,144 +2135,326 @@ def command_cooldown(seconds: int):
     return decorator
 
 # 12. HELPER FUNCTIONS
-async def process_message_filters(msg, role, category, channel, search, date_from, date_to):
-    """Process all message filters"""
-    try:
-        # Role check
-        member = msg.guild.get_member(msg.author.id)
-        if not member or role not in member.roles:
-            return False
+class MessageRecord(NamedTuple):
+    """Exportable fields of a message, whether fetched live or read from the store"""
+    id: int
+    channel_id: int
+    author_id: int
+    author: str
+    content: str
+    channel: str
+    created_at: datetime
+    attachments: str
+    reactions: str
+    reply_to: str
+    edited_at: Optional[datetime]
+    embeds: int
+    pinned: bool
 
-        # Category check
-        if category and channel not in category.channels:
-            return False
+    @classmethod
+    def from_message(cls, message: discord.Message, names: Optional[dict] = None) -> 'MessageRecord':
+        """names memoizes author and channel names by ID across one export"""
+        live = LiveMessageRecord(message, {} if names is None else names)
+        reference = message.reference
+        # Positional: keyword construction of a NamedTuple is measurably slower per message
+        return cls(
+            live.id, live.channel_id, live.author_id, live.author, live.content, live.channel, live.created_at,
+            ', '.join([a.url for a in message.attachments]) if message.attachments else '',
+            ', '.join([f"{r.emoji}:{r.count}" for r in message.reactions]) if message.reactions else '',
+            str(reference.message_id) if reference else '',
+            message.edited_at, len(message.embeds), message.pinned
+        )
 
-        # Search check
-        if search and search.lower() not in msg.content.lower():
+class LiveMessageRecord:
+    """MessageRecord view of a discord.Message that formats the optional fields only when read"""
+    __slots__ = ('message', 'id', 'channel_id', 'author_id', 'author', 'content', 'channel', 'created_at')
+
+    def __init__(self, message: discord.Message, names: dict):
+        self.message = message
+        self.id = message.id
+        self.content = message.content
+        self.created_at = message.created_at
+        author = message.author
+        self.author_id = author_id = author.id
+        self.author = names.get(author_id)
+        if self.author is None:
+            self.author = names[author_id] = str(author)
+        channel = message.channel
+        self.channel_id = channel_id = channel.id
+        self.channel = names.get(channel_id)
+        if self.channel is None:
+            self.channel = names[channel_id] = channel.name
+
+    @property
+    def attachments(self) -> str:
+        return ', '.join([a.url for a in self.message.attachments])
+
+    @property
+    def reactions(self) -> str:
+        return ', '.join([f"{r.emoji}:{r.count}" for r in self.message.reactions])
+
+    @property
+    def reply_to(self) -> str:
+        reference = self.message.reference
+        return str(reference.message_id) if reference else ''
+
+    @property
+    def edited_at(self) -> Optional[datetime]:
+        return self.message.edited_at
+
+    @property
+    def embeds(self) -> int:
+        return len(self.message.embeds)
+
+    @property
+    def pinned(self) -> bool:
+        return self.message.pinned
+
+def date_window_to_snowflakes(date_from: Optional[str], date_to: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Exclusive snowflake bounds for start_date <= created_at <= end_date (UTC)"""
+    after_id = before_id = None
+    if date_from:
+        start_date = datetime.strptime(date_from, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        after_id = discord.utils.time_snowflake(start_date) - 1
+    if date_to:
+        end_date = datetime.strptime(date_to, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        before_id = discord.utils.time_snowflake(end_date, high=True) + 1
+    return after_id, before_id
+
+def compile_message_filter(role, category, channel, search, date_from, date_to) -> Callable[[MessageRecord], bool]:
+    """Build the export's message predicate once, cheapest checks first
+
+    Dates become snowflake bounds, the category check is settled up front,
+    role members come from the cached index and the search term is lowercased
+    once, so per message only integer comparisons, a set lookup and one
+    substring scan remain.
+    """
+    # Category check depends only on the channel
+    if category and channel.id not in {c.id for c in category.channels}:
+        return lambda record: False
+
+    # Date check, compared by ID
+    after_id, before_id = date_window_to_snowflakes(date_from, date_to)
+
+    role_members = role_index.get(role)
+    include_departed = ROLE_FILTER_DEPARTED_POLICY == "include"
+    get_member = channel.guild.get_member
+    term = search.lower() if search else None
+
+    def matches(record: MessageRecord) -> bool:
+        if after_id is not None and record.id <= after_id:
+            return False
+        if before_id is not None and record.id >= before_id:
             return False
 
-        # Date check
-        if date_from and date_to:
-            try:
-                start_date = datetime.strptime(date_from, '%Y-%m-%d')
-                end_date = datetime.strptime(date_to, '%Y-%m-%d')
-                if not (start_date <= msg.created_at.replace(tzinfo=None) <= end_date):
-                    return False
-            except ValueError:
-                logger.error("Date parsing error")
+        # Role check, optionally keeping authors no longer in the guild
+        if record.author_id not in role_members:
+            if not include_departed or get_member(record.author_id) is not None:
                 return False
 
+        # Search check
+        if term and term not in record.content.lower():
+            return False
         return True
-    except Exception as e:
-        logger.error(f"Filter error: {e}")
-        return False
 
-async def create_message_data(message: discord.Message, data_options: Optional[str] = None) -> Optional[dict]:
-    """Create message data dictionary with optional data fields"""
+    return matches
+
+def format_timestamp(value: Optional[datetime]) -> str:
+    """Format a datetime as YYYY-MM-DD HH:MM:SS (%-formatting the fields is cheaper than strftime)"""
+    if not value:
+        return ''
+    return '%04d-%02d-%02d %02d:%02d:%02d' % (
+        value.year, value.month, value.day, value.hour, value.minute, value.second
+    )
+
+# Export columns as (header, extractor) pairs
+BASE_COLUMNS = [
+    ('Message ID', lambda r: str(r.id)),
+    ('Author', operator.attrgetter('author')),
+    ('Content', operator.attrgetter('content')),
+    ('Channel', operator.attrgetter('channel')),
+    ('Timestamp', lambda r: format_timestamp(r.created_at)),
+]
+
+# Optional columns keyed by data option number
+OPTIONAL_COLUMNS = {
+    1: ('Attachments', operator.attrgetter('attachments')),
+    2: ('Reactions', operator.attrgetter('reactions')),
+    3: ('Reply To', operator.attrgetter('reply_to')),
+    4: ('Edited', lambda r: format_timestamp(r.edited_at)),
+    5: ('Embeds', operator.attrgetter('embeds')),
+    6: ('Pinned', operator.attrgetter('pinned')),
+}
+
+# Typical encoded bytes per cell, used to estimate export cost before running
+COLUMN_SIZE_ESTIMATES = {
+    'Message ID': 19, 'Author': 16, 'Content': 120, 'Channel': 16, 'Timestamp': 19,
+    'Attachments': 60, 'Reactions': 20, 'Reply To': 19, 'Edited': 19, 'Embeds': 40, 'Pinned': 5,
+}
+
+def compile_row_builder(data_options: Optional[str] = None) -> Tuple[List[str], Callable[[MessageRecord], tuple]]:
+    """Resolve data_options once into a fixed column list and a record -> tuple builder"""
     try:
-        # Parse data options
         options = set(map(int, data_options.split(','))) if data_options else set()
-        
-        # Base message data
-        data = {
-            'Message ID': str(message.id),
-            'Author': str(message.author),
-            'Content': message.content,
-            'Channel': message.channel.name,
-            'Timestamp': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-        }
-        
-        # Optional data based on options
-        if 1 in options:  # Attachments
-            data['Attachments'] = ', '.join([a.url for a in message.attachments])
-            
-        if 2 in options:  # Reactions
-            data['Reactions'] = ', '.join([f"{r.emoji}:{r.count}" for r in message.reactions])
-            
-        if 3 in options:  # Reply References
-            data['Reply To'] = str(message.reference.message_id) if message.reference else ''
-            
-        if 4 in options:  # Message Edits
-            data['Edited'] = message.edited_at.strftime('%Y-%m-%d %H:%M:%S') if message.edited_at else ''
-            
-        if 5 in options:  # Embeds
-            data['Embeds'] = len(message.embeds)
-            
-        if 6 in options:  # Pinned Status
-            data['Pinned'] = message.pinned
-            
-        return data
-    except Exception as e:
-        logger.error(f"Error creating message data: {e}")
-        return None
+    except ValueError:
+        raise ValueError("Invalid data options. Use numbers 1-6 separated by commas")
 
-class SafeBuffer:
-    """Context manager for safe buffer handling"""
-    def __init__(self):
-        self.buffers = []
+    selected = BASE_COLUMNS + [OPTIONAL_COLUMNS[o] for o in sorted(options) if o in OPTIONAL_COLUMNS]
+    columns = [name for name, _ in selected]
+    extractors = [extract for _, extract in selected]
 
-    def create_buffer(self, buffer_type=io.BytesIO):
-        buffer = buffer_type()
-        self.buffers.append(buffer)
-        return buffer
+    def build(record: MessageRecord) -> tuple:
+        return tuple([extract(record) for extract in extractors])
 
-    def __enter__(self):
-        return self
+    return columns, build
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        for buffer in self.buffers:
-            try:
-                buffer.close()
-            except:
-                pass
+@retry_on_error(retries=UPLOAD_RETRIES, delay=UPLOAD_RETRY_DELAY)
+async def send_export_part(channel, content: str, part):
+    """Upload one finished part, wrapping it in a fresh discord.File for every attempt"""
+    async with rate_limiter.request(('send', channel.id)):
+        await channel.send(content, file=discord.File(part.output(), filename=part.filename))
 
 # Use in save_and_send_messages
-async def save_and_send_messages(messages: List[dict], channel_name: str, suffix: str, is_csv: bool, chunk_size: int, message: discord.Message):
-    """Save messages to file and send to channel"""
+async def save_and_send_messages(part, closing, message: discord.Message, size_limit: Optional[int] = None):
+    """Wait for a part to be finished and send it to the channel
+
+    Raises if the part could not be finished or uploaded, or is still over the
+    upload limit, so the export fails instead of completing with the part's
+    rows missing.
+    """
     try:
-        # Create DataFrame
-        df = pd.DataFrame(messages)
-        
-        # Prepare filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{channel_name}_{timestamp}_{suffix}"
-        
-        # Save to temp file
-        temp_path = data_dir.get_temp_file(filename)
-        if is_csv:
-            df.to_csv(f"{temp_path}.csv", index=False, encoding='utf-8-sig')
-            file_path = f"{temp_path}.csv"
-        else:
-            df.to_excel(f"{temp_path}.xlsx", index=False)
-            file_path = f"{temp_path}.xlsx"
+        # Wait for the background writer to flush and close the part
+        await closing
         
-        # Send file
-        await message.channel.send(
-            f"📊 Export part ({len(messages):,} messages)",
-            file=discord.File(file_path)
-        )
+        if size_limit and part.file_size > size_limit / UPLOAD_SIZE_MARGIN:
+            raise ValueError(
+                f"Export part ({part.row_count:,} messages) is {part.file_size / 1024 / 1024:.1f} MB, "
+                f"over this server's {size_limit / UPLOAD_SIZE_MARGIN / 1024 / 1024:.0f} MB upload limit"
+            )
         
-        # Cleanup temp file
-        try:
-            os.remove(file_path)
-        except:
-            pass
+        # Send file, retrying transient failures
+        await send_export_part(message.channel, f"📊 Export part ({part.row_count:,} messages)", part)
             
     except Exception as e:
         logger.error(f"Error saving messages: {e}")
-        await message.channel.send(f"❌ Error saving messages: {str(e)}")
+        try:
+            await message.channel.send(f"❌ Error saving messages: {str(e)}")
+        except Exception as report_error:
+            # Keep the upload error; the report is best effort
+            logger.error(f"Failed to report export error: {report_error}")
+        raise
+    finally:
+        # Release the part buffer or temp file
+        try:
+            part.discard()
+        except:
+            pass
+
+# Add to helper functions
+class MessageCountEstimator:
+    """Estimate message counts from snowflake timestamps instead of a full history scan
+
+    One history page is sampled at each end of the range, the message density
+    is extrapolated over the time span between them, and the estimate keeps
+    converging while the real fetch walks the history newest to oldest.
+    """
+    def __init__(self, channel: discord.TextChannel, after_id: Optional[int] = None,
+                 before_id: Optional[int] = None, sample_size: int = ESTIMATE_SAMPLE_SIZE):
+        self.channel = channel
+        self.after_id = after_id  # exclusive snowflake bounds of the range
+        self.before_id = before_id
+        self.sample_size = sample_size
+        self.total = 0
+        self.exact = False
+        self.density = 0.0  # messages per second
+        self.newest_time = None
+        self.oldest_time = None
+        self.newest_id = None  # IDs of the sampled boundary messages
+        self.oldest_id = None
+
+    @staticmethod
+    def _page_density(page: List[discord.Message]) -> Optional[float]:
+        """Messages per second within a sampled page"""
+        times = [m.created_at for m in page]
+        span = (max(times) - min(times)).total_seconds()
+        if span <= 0:
+            return None
+        return (len(page) - 1) / span
+
+    async def estimate(self) -> int:
+        """Sample both ends of the range and extrapolate the total"""
+        after = discord.Object(id=self.after_id) if self.after_id else None
+        before = discord.Object(id=self.before_id) if self.before_id else None
+        try:
+            async with rate_limiter.request(('history', self.channel.id)):
+                newest = [m async for m in self.channel.history(
+                    limit=self.sample_size, after=after, before=before, oldest_first=False
+                )]
+            if len(newest) < self.sample_size:
+                # The whole range fits in one page
+                self.total = len(newest)
+                self.exact = True
+                return self.total
+
+            async with rate_limiter.request(('history', self.channel.id)):
+                oldest = [m async for m in self.channel.history(
+                    limit=self.sample_size, after=after, before=before, oldest_first=True
+                )]
+            if oldest and oldest[-1].id >= newest[-1].id:
+                # Pages overlap, so the range holds fewer than two pages
+                self.total = len({m.id for m in newest} | {m.id for m in oldest})
+                self.exact = True
+                return self.total
+
+            self.newest_time = newest[0].created_at
+            self.oldest_time = oldest[0].created_at
+            self.newest_id = newest[0].id
+            self.oldest_id = oldest[0].id
+            densities = [d for d in (self._page_density(newest), self._page_density(oldest)) if d]
+            span = (self.newest_time - self.oldest_time).total_seconds()
+            if densities:
+                self.density = sum(densities) / len(densities)
+            elif span > 0:
+                self.density = 2 * self.sample_size / span
+            self.total = max(int(self.density * span) + 1, 2 * self.sample_size)
+            return self.total
+        except Exception as e:
+            logger.error(f"Error estimating message count: {e}")
+            return 0
 
-# Add to helper functions
-async def estimate_message_count(channel: discord.TextChannel, role=None, after=None, before=None) -> int:
-    """Estimate total messages for progress tracking"""
-    try:
-        count = 0
-        async for _ in channel.history(limit=None, after=after, before=before):
-            count += 1
-        return count
-    except Exception as e:
-        logger.error(f"Error estimating message count: {e}")
-        return 0
+    def estimate_between(self, after_id: int, before_id: int) -> int:
+        """Extrapolate the number of messages between two snowflake IDs"""
+        if self.exact:
+            return self.total
+        span = (discord.utils.snowflake_time(before_id) - discord.utils.snowflake_time(after_id)).total_seconds()
+        return int(self.density * max(span, 0))
+
+    def refine(self, processed: int, cursor_time: datetime) -> int:
+        """Blend the sampled density with the density observed so far
+
+        processed is the number of messages fetched and cursor_time the
+        creation time of the oldest one, as the fetch runs newest first.
+        """
+        if self.exact or self.newest_time is None:
+            self.total = max(self.total, processed)
+            return self.total
+
+        covered = (self.newest_time - cursor_time).total_seconds()
+        remaining = (cursor_time - self.oldest_time).total_seconds()
+        if remaining <= 0:
+            self.total = processed
+        elif covered > 0:
+            weight = covered / (covered + remaining)
+            density = weight * (processed / covered) + (1 - weight) * self.density
+            self.total = processed + int(density * remaining)
+        self.total = max(self.total, processed)
+        return self.total
+
+    def finish(self, processed: int) -> int:
+        """Pin the total to the real count once the fetch is done"""
+        self.total = processed
+        self.exact = True
+        return self.total
 
 # After imports but before using memory_monitor
 class MemoryMonitor:
@@ -874,33 +2509,599 @@ class MemoryMonitor:
 # Initialize memory monitor after class definition
 memory_monitor = MemoryMonitor()
 
+# One rate limiter for every Discord request the process makes
+rate_limiter = RateLimiter()
+
+# Served on /metrics when METRICS_PORT or PORT is set
+metrics = Metrics()
+
+# Started with the bot, see ExporterBot.setup_hook
+loop_monitor = LoopLagMonitor()
+
+# Closes (saves/compresses) finished export parts off the event loop
+serialization_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=SERIALIZATION_WORKERS, thread_name_prefix='export-writer'
+)
+serialization_pool = None  # process pool for SERIALIZATION_BACKEND = "process", started on first use
+
+def get_serialization_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """Return the serialization process pool, starting it on first use
+
+    Workers are spawned rather than forked: the bot process runs discord.py,
+    compressor and watchdog threads whose locks a fork could copy mid-use.
+    Spawned workers re-import the main script, which is the thin run.py, and
+    build parts with excel_parts alone.
+    """
+    global serialization_pool
+    if serialization_pool is None:
+        serialization_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=SERIALIZATION_PROCESSES or os.cpu_count(),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=excel_parts.init_worker
+        )
+    return serialization_pool
+
+class MessageStore:
+    """Local SQLite copy of exported channel history
+
+    Messages are kept by snowflake ID along with the ID range synced for each
+    channel, so repeat exports only fetch history above the high-water mark
+    (minus STORE_RECHECK_HOURS, to pick up recent edits) and read the rest
+    from disk.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                message_id INTEGER PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                author_id INTEGER NOT NULL,
+                author TEXT NOT NULL,
+                content TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                attachments TEXT NOT NULL,
+                reactions TEXT NOT NULL,
+                reply_to TEXT NOT NULL,
+                edited_at REAL,
+                embeds INTEGER NOT NULL,
+                pinned INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_by_channel ON messages (channel_id, message_id);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                channel_id INTEGER PRIMARY KEY,
+                low_id INTEGER NOT NULL,
+                high_id INTEGER NOT NULL,
+                synced_at REAL NOT NULL
+            );
+            CREATE TEMP TABLE IF NOT EXISTS seen (
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                PRIMARY KEY (channel_id, message_id)
+            );
+        """)
+        self._conn.commit()
+        os.chmod(path, FILE_PERMISSION)
+
+    def get_synced_range(self, channel_id: int) -> Optional[Tuple[int, int]]:
+        """Inclusive ID range of the channel's history held locally"""
+        row = self._conn.execute(
+            "SELECT low_id, high_id FROM sync_state WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def mark_synced(self, channel_id: int, low_id: int, high_id: int):
+        """Record a fully fetched ID range, merging it with the existing one if they touch"""
+        synced = self.get_synced_range(channel_id)
+        if synced and low_id <= synced[1] + 1 and high_id >= synced[0] - 1:
+            low_id, high_id = min(low_id, synced[0]), max(high_id, synced[1])
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sync_state (channel_id, low_id, high_id, synced_at) VALUES (?, ?, ?, ?)",
+            (channel_id, low_id, high_id, time.time())
+        )
+        self._conn.commit()
+
+    def save_records(self, records: List[MessageRecord]):
+        """Insert or refresh a batch of messages, noting them as seen for prune_range"""
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO seen VALUES (?, ?)",
+            [(r.channel_id, r.id) for r in records]
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (r.id, r.channel_id, r.author_id, r.author, r.content, r.channel,
+                 r.attachments, r.reactions, r.reply_to,
+                 r.edited_at.timestamp() if r.edited_at else None, r.embeds, int(r.pinned))
+                for r in records
+            ]
+        )
+        self._conn.commit()
+
+    def prune_range(self, channel_id: int, after_id: int, before_id: int) -> int:
+        """Delete messages between two exclusive IDs that the last full fetch did not return"""
+        deleted = self._conn.execute(
+            "DELETE FROM messages WHERE channel_id = ? AND message_id > ? AND message_id < ? "
+            "AND message_id NOT IN (SELECT message_id FROM seen WHERE channel_id = ?)",
+            (channel_id, after_id, before_id, channel_id)
+        ).rowcount
+        self.forget_seen(channel_id, after_id, before_id)
+        return deleted
+
+    def forget_seen(self, channel_id: int, after_id: int, before_id: int):
+        """Clear seen marks between two exclusive IDs, e.g. left over from an interrupted fetch"""
+        self._conn.execute(
+            "DELETE FROM seen WHERE channel_id = ? AND message_id > ? AND message_id < ?",
+            (channel_id, after_id, before_id)
+        )
+        self._conn.commit()
+
+    def load_records(self, channel_id: int, after_id: int, before_id: int, limit: int) -> List[MessageRecord]:
+        """Read up to `limit` messages between two exclusive IDs, newest first"""
+        rows = self._conn.execute(
+            "SELECT * FROM messages WHERE channel_id = ? AND message_id > ? AND message_id < ? "
+            "ORDER BY message_id DESC LIMIT ?",
+            (channel_id, after_id, before_id, limit)
+        ).fetchall()
+        return [
+            MessageRecord(
+                id=row[0],
+                channel_id=row[1],
+                author_id=row[2],
+                author=row[3],
+                content=row[4],
+                channel=row[5],
+                created_at=discord.utils.snowflake_time(row[0]),
+                attachments=row[6],
+                reactions=row[7],
+                reply_to=row[8],
+                edited_at=datetime.fromtimestamp(row[9], timezone.utc) if row[9] is not None else None,
+                embeds=row[10],
+                pinned=bool(row[11])
+            )
+            for row in rows
+        ]
+
+    async def iter_records(self, channel_id: int, after_id: int, before_id: int):
+        """Yield stored messages between two exclusive IDs, newest first"""
+        cursor = before_id
+        while True:
+            batch = self.load_records(channel_id, after_id, cursor, STORE_READ_BATCH)
+            for record in batch:
+                yield record
+            if len(batch) < STORE_READ_BATCH:
+                break
+            cursor = batch[-1].id
+
+    def close(self):
+        self._conn.close()
+
+# Role filter cache, invalidated from member and role events
+role_index = RoleMembershipIndex()
+
+# Open the local message store
+message_store = None
+if MESSAGE_STORE_ENABLED:
+    try:
+        message_store = MessageStore(data_dir.get_state_file(MESSAGE_STORE_FILE))
+    except Exception as e:
+        logger.error(f"Message store unavailable, exports will fetch full history: {e}")
+
+export_checkpoints = ExportCheckpoints(data_dir.get_state_file(EXPORT_CHECKPOINT_FILE))
+
+class HistoryPrefetcher:
+    """Read channel history with page requests issued ahead of the consumer
+
+    A background task keeps up to `depth` pages buffered, so the request for
+    the next page is already in flight while the current one is processed.
+    discord.py's HTTP client honours the per-bucket rate-limit headers on
+    every page request; the reader only adds retries for transient errors.
+    """
+    def __init__(self, channel, after: Optional[int] = None, before: Optional[int] = None,
+                 depth: int = HISTORY_PREFETCH_DEPTH, page_size: int = HISTORY_PAGE_SIZE,
+                 limiter: Optional[asyncio.Semaphore] = None):
+        self.channel = channel
+        self.after = after  # snowflake IDs bounding the read, both exclusive
+        self.before = before
+        self.depth = depth
+        self.page_size = page_size
+        self.limiter = limiter  # shared with other cursors on the same channel
+        self.pages_fetched = 0
+        self._queue = None
+        self._producer = None
+
+    @retry_on_error(retries=MAX_RETRIES, delay=RATE_LIMIT_DELAY)
+    async def _fetch_page(self, before: Optional[int]) -> List[discord.Message]:
+        """Fetch one page of history, newest first"""
+        async with rate_limiter.request(('history', self.channel.id)):
+            started = time.perf_counter()
+            page = [m async for m in self.channel.history(
+                limit=self.page_size,
+                before=discord.Object(id=before) if before else None,
+                after=discord.Object(id=self.after) if self.after else None,
+                oldest_first=False
+            )]
+            metrics.history_page_seconds.observe(time.perf_counter() - started)
+            return page
+
+    async def _produce(self, queue: asyncio.Queue):
+        """Fetch pages back to back until history or the range is exhausted
+
+        Pages are requested newest first from `before`; discord.py drops the
+        messages at or below `after`, so the first page that crosses the lower
+        bound comes back short and ends the read.
+        """
+        try:
+            before = self.before
+            while True:
+                if self.limiter:
+                    async with self.limiter:
+                        page = await self._fetch_page(before)
+                else:
+                    page = await self._fetch_page(before)
+                self.pages_fetched += 1
+                if page:
+                    await queue.put(page)
+                if len(page) < self.page_size:
+                    break
+                before = page[-1].id
+            await queue.put(None)
+        except Exception as e:
+            # Hand the error to the consumer instead of leaving it waiting
+            await queue.put(e)
+
+    def start(self):
+        """Start fetching in the background before iteration begins"""
+        if self._producer is None:
+            self._queue = asyncio.Queue(maxsize=self.depth)
+            self._producer = asyncio.create_task(self._produce(self._queue))
+
+    async def close(self):
+        """Stop the background fetch"""
+        if self._producer and not self._producer.done():
+            self._producer.cancel()
+            await asyncio.gather(self._producer, return_exceptions=True)
+
+    async def _iter_messages(self):
+        self.start()
+        try:
+            while True:
+                page = await self._queue.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                for message in page:
+                    yield message
+        finally:
+            await self.close()
+
+    def __aiter__(self):
+        return self._iter_messages()
+
+class PartitionedHistoryReader:
+    """Fetch a long history range as concurrent snowflake-ID partitions
+
+    The range is cut into equal time slices, each read by its own
+    HistoryPrefetcher cursor. Up to `concurrency` partitions fetch at once and
+    share one semaphore for page requests; messages are yielded newest first,
+    partition by partition, so the output order matches a single cursor.
+    """
+    def __init__(self, channel, after: int, before: int, partitions: int,
+                 concurrency: int = HISTORY_FETCH_CONCURRENCY,
+                 buffer_pages: int = PARTITION_BUFFER_PAGES):
+        self.channel = channel
+        self.concurrency = concurrency
+        self.buffer_pages = buffer_pages
+        self.limiter = asyncio.Semaphore(concurrency)
+        self.ranges = self._split(after, before, max(partitions, 1))
+
+    @staticmethod
+    def _split(after: int, before: int, partitions: int) -> List[Tuple[int, int]]:
+        """Split (after, before) into exclusive (after, before) ranges, newest first"""
+        step = max((before - after) // partitions, 1)
+        bounds = [after + step * i for i in range(partitions) if after + step * i < before]
+        bounds.append(before)
+        # Inner boundaries belong to the older partition: (b0, b1], (b1, b2], ...
+        ranges = [
+            (bounds[i], bounds[i + 1] + 1 if i + 2 < len(bounds) else bounds[i + 1])
+            for i in range(len(bounds) - 1)
+        ]
+        return ranges[::-1]
+
+    async def _iter_messages(self):
+        readers = [
+            HistoryPrefetcher(self.channel, after, before,
+                              depth=self.buffer_pages, limiter=self.limiter)
+            for after, before in self.ranges
+        ]
+        try:
+            for index, reader in enumerate(readers):
+                # Keep the next partitions fetching while this one is drained
+                for ahead in readers[index:index + self.concurrency]:
+                    ahead.start()
+                async for message in reader:
+                    yield message
+        finally:
+            for reader in readers:
+                await reader.close()
+
+    def __aiter__(self):
+        return self._iter_messages()
+
+def open_history_reader(channel, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                        estimator=None):
+    """Pick a sequential or partitioned history reader for an ID range
+
+    Partitioning needs the boundary messages sampled by the estimator, so the
+    partitioned read covers the range as it was when the export started.
+    """
+    lower = after_id if after_id else channel.id - 1
+    upper = before_id if before_id else discord.utils.time_snowflake(datetime.now(timezone.utc), high=True) + 1
+    if estimator and estimator.oldest_id:
+        # Sampled boundary messages bound any range inside the estimated one
+        if (estimator.after_id or 0) <= lower:
+            lower = max(lower, estimator.oldest_id - 1)
+        if estimator.before_id is None or upper <= estimator.before_id:
+            upper = min(upper, estimator.newest_id + 1)
+
+    estimated = estimator.estimate_between(lower, upper) if estimator else 0
+    if HISTORY_FETCH_CONCURRENCY > 1 and estimated >= PARTITION_MIN_MESSAGES:
+        partitions = max(HISTORY_FETCH_CONCURRENCY, math.ceil(estimated / PARTITION_TARGET_MESSAGES))
+        logger.info(f"Fetching #{channel.name} history in {partitions} partitions")
+        return PartitionedHistoryReader(channel, lower, upper, partitions)
+    return HistoryPrefetcher(channel, after_id, before_id)
+
+async def iter_live_records(channel, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                            estimator=None, store: Optional[MessageStore] = None):
+    """Fetch an ID range from Discord as records, writing them through to the store
+
+    Without a store the records are LiveMessageRecords, so optional fields no
+    column selects are never formatted.
+    """
+    batch = []
+    names = {}
+    async for message in open_history_reader(channel, after_id, before_id, estimator):
+        if not store:
+            yield LiveMessageRecord(message, names)
+            continue
+        record = MessageRecord.from_message(message, names)
+        batch.append(record)
+        if len(batch) >= HISTORY_PAGE_SIZE:
+            store.save_records(batch)
+            batch = []
+        yield record
+    if store and batch:
+        store.save_records(batch)
+
+async def iter_synced_records(channel, store: MessageStore, estimator=None,
+                              after_id: Optional[int] = None, before_id: Optional[int] = None):
+    """Yield an ID range newest first, reading the locally synced part from the store
+
+    Only the history above the channel's high-water mark (less the recheck
+    window for edits) and below its low-water mark is fetched from Discord.
+    """
+    lower = after_id or 0
+    upper = before_id or discord.utils.time_snowflake(datetime.now(timezone.utc), high=True) + 1
+
+    synced = store.get_synced_range(channel.id)
+    if synced and synced[0] < upper and synced[1] > lower:
+        low_id, high_id = synced
+        recheck_from = discord.utils.snowflake_time(high_id) - timedelta(hours=STORE_RECHECK_HOURS)
+        recheck_id = max(low_id, discord.utils.time_snowflake(recheck_from))
+        segments = []
+        if upper - 1 > recheck_id:
+            segments.append(('live', max(lower, recheck_id), upper))
+        if min(upper, recheck_id + 1) - max(lower, low_id - 1) > 1:
+            segments.append(('stored', max(lower, low_id - 1), min(upper, recheck_id + 1)))
+        if lower + 1 < low_id:
+            segments.append(('live', lower, low_id))
+    else:
+        segments = [('live', lower, upper)]
+
+    fetched = []
+    for source, segment_after, segment_before in segments:
+        if source == 'stored':
+            async for record in store.iter_records(channel.id, segment_after, segment_before):
+                yield record
+        else:
+            store.forget_seen(channel.id, segment_after, segment_before)
+            async for record in iter_live_records(channel, segment_after, segment_before, estimator, store):
+                yield record
+            fetched.append((segment_after + 1, segment_before - 1))
+
+    # Only ranges that were read to the end count as synced, and only those
+    # prove that stored messages missing from them were deleted on Discord
+    for low_id, high_id in fetched:
+        deleted = store.prune_range(channel.id, low_id - 1, high_id + 1)
+        if deleted:
+            logger.info(f"Removed {deleted} deleted messages of #{channel.name} from the store")
+        store.mark_synced(channel.id, low_id, high_id)
+
 # Update the fetch function to not use memory monitor
-async def fetch_messages_with_pagination(channel, progress):
-    """Fetch messages with pagination and filtering"""
-    messages = []
+async def fetch_messages_with_pagination(channel, progress, estimator=None, store=None,
+                                         after_id: Optional[int] = None, before_id: Optional[int] = None):
+    """Stream channel history between two snowflake IDs as records, tracking progress
+
+    The bounds are pushed down into the history requests, so paging starts at
+    the end of the window and stops at the first page that crosses its start.
+    """
     try:
-        async for message in channel.history(limit=None):
-            try:
-                # Process message
-                message_data = await create_message_data(message)
-                if message_data:
-                    messages.append(message_data)
-                
-                # Update progress
-                await progress.update()
-                
-            except Exception as e:
-                logger.error(f"Error processing message {message.id}: {e}")
-                continue
+        if store:
+            records = iter_synced_records(channel, store, estimator, after_id, before_id)
+        else:
+            records = iter_live_records(channel, after_id, before_id, estimator)
+        async for record in records:
+            # Counted only; the progress ticker renders it
+            progress.count += 1
+
+            # Refine the estimated total once per page
+            if estimator and progress.count % progress.batch_size == 0:
+                progress.total = estimator.refine(progress.count, record.created_at)
+
+            yield record
                 
     except Exception as e:
         logger.error(f"Error fetching messages: {e}")
         raise
-        
-    if not messages:
+
+    if estimator:
+        progress.total = estimator.finish(progress.count)
+        progress.total_is_estimate = False
+
+async def submit_export_job(job: ExportJob) -> bool:
+    """Estimate, admit and queue an export job; return False if it was rejected
+
+    Shared by /export and by exports resumed from a checkpoint, whose window
+    is narrowed to the messages older than the last delivered part.
+    """
+    params = job.params
+    columns, build_record_row = compile_row_builder(params['data_options'])
+
+    # Estimate the date window from samples and decide what the export may cost
+    after_id, before_id = date_window_to_snowflakes(params['date_from'], params['date_to'])
+    if params.get('resume_before_id'):
+        before_id = min(before_id, params['resume_before_id']) if before_id else params['resume_before_id']
+    estimator = MessageCountEstimator(job.channel, after_id, before_id)
+    estimated_count = await estimator.estimate()
+
+    # Parts are cut just under the upload limit; chunk_size only caps rows when given
+    format = params['format']
+    max_rows = MAX_MESSAGES_CSV if format == "csv" else MAX_MESSAGES_EXCEL
+    chunk_size = params.get('chunk_size')
+    part_rows = params.get('part_rows') or (min(chunk_size, max_rows) if chunk_size else max_rows)
+    size_limit = int(job.channel.guild.filesize_limit * UPLOAD_SIZE_MARGIN)
+
+    decision = client.scheduler.admission.decide(estimated_count, columns, format, part_rows, size_limit)
+    if decision.action == "reject":
+        await job.message.edit(content=f"❌ Export rejected: {decision.reason}. Try a narrower date range.")
+        export_checkpoints.discard(job.key)
+        return False
+    if decision.format != format or decision.part_rows != part_rows:
+        await job.notify(f"⚠️ {decision.reason}")
+    elif decision.action == "queue":
+        job.queue_reason = decision.reason
+    params['format'], params['part_rows'] = decision.format, decision.part_rows
+
+    job.estimated_count = estimated_count
+    job.cost = decision.cost
+
+    # Hand the export to the scheduler; it starts now or waits its turn with its position shown
+    client.scheduler.submit(
+        job,
+        functools.partial(run_export_job, job, estimator, columns, build_record_row, after_id, before_id, size_limit)
+    )
+    return True
+
+async def run_export_job(job: ExportJob, estimator, columns, build_record_row,
+                         after_id, before_id, size_limit) -> int:
+    """Run the export once the scheduler gives it a slot; return the matched count"""
+    params = job.params
+    channel = job.channel
+    progress_message = job.message
+    rows_delivered = params.get('rows_delivered', 0)
+
+    # Initialize progress tracker from the sampled estimate
+    progress = ProgressTracker(progress_message, total=job.estimated_count)
+    progress.total_is_estimate = not estimator.exact
+    job.progress = progress
+
+    # Memory checks; raising fails the job so it isn't counted as a successful export
+    if not await client.check_memory():
+        await progress_message.edit(content="⚠️ Low memory available. Try smaller chunk size.")
+        raise MemoryError("Low memory available. Try smaller chunk size.")
+
+    await progress_message.edit(content="Processing your request...")
+
+    # Check memory before starting
+    is_ok, warning = memory_monitor.check()
+    if not is_ok:
+        await progress_message.edit(content=f"❌ {warning}")
+        raise MemoryError(warning)
+    elif warning:
+        logger.warning(warning)
+
+    message_filter = compile_message_filter(
+        job.role, job.category, channel, params['search'], params['date_from'], params['date_to']
+    )
+
+    def build_row(record):
+        try:
+            if not message_filter(record):
+                return None
+            progress.filtered_count += 1
+            return build_record_row(record)
+        except Exception as e:
+            logger.error(f"Error processing message {record.id}: {e}")
+            return None
+
+    # Stream messages through filtering and chunked output
+    # xlsx files are already deflated, so only CSV parts are compressed
+    format = params['format']
+    part_compression = params['compression'] if format == "csv" else None
+    progress.start()
+    try:
+        with SafeBuffer() as buffers:
+            chunker = MessageChunker(
+                params['part_rows'], columns, channel.name, format == "csv", progress_message, buffers, size_limit,
+                part_compression, on_part_delivered=job.part_delivered, on_part_failed=job.part_failed,
+                first_part=params.get('parts_delivered', 0) + 1, stage_times=progress.stage_times
+            )
+            pipeline = ExportPipeline(
+                fetch_messages_with_pagination(channel, progress, estimator, message_store, after_id, before_id),
+                build_row,
+                chunker,
+                stage_times=progress.stage_times
+            )
+            try:
+                matched = await pipeline.run()
+            except MemoryError as e:
+                await progress_message.edit(content=f"❌ {e}")
+                raise
+    finally:
+        progress.stop()
+    progress.rate = progress.count / max(time.monotonic() - progress.started_at, 1e-9)
+    await progress.update(force=True)
+
+    if job.delivery_failed:
+        raise RuntimeError("Some export parts could not be delivered")
+    if not matched and not rows_delivered:
         raise ValueError("No messages found matching the criteria")
-        
-    return messages
+    return matched + rows_delivered
+
+async def resume_export_jobs():
+    """Requeue exports that were interrupted by the last shutdown or failed to deliver a part"""
+    for checkpoint in export_checkpoints.pending():
+        key = checkpoint['key']
+        try:
+            params = checkpoint['params']
+            guild = client.get_guild(checkpoint['guild_id'])
+            channel = guild and guild.get_channel(checkpoint['channel_id'])
+            reply_channel = guild and guild.get_channel(checkpoint['reply_channel_id'])
+            role = guild and guild.get_role(params['role_id'])
+            category = None
+            if guild and params.get('category_id'):
+                category = guild.get_channel(params['category_id'])
+            if not (channel and reply_channel and role) or (params.get('category_id') and not category):
+                logger.warning(f"Dropping export checkpoint {key}: guild, channel or role is gone")
+                export_checkpoints.discard(key)
+                continue
+
+            params['resume_attempts'] = params.get('resume_attempts', 0) + 1
+            message = await reply_channel.send(
+                f"🔄 Resuming interrupted export of #{channel.name} "
+                f"({params.get('parts_delivered', 0)} part(s) already delivered)"
+            )
+            job = ExportJob(
+                checkpoint['guild_id'], checkpoint['user_id'], checkpoint['user_name'], channel, message, params,
+                role, category, key=key
+            )
+            await submit_export_job(job)
+            logger.info(f"Resumed export {key} in guild {guild.id}")
+        except Exception as e:
+            logger.error(f"Error resuming export {key}: {e}")
 
 # 13. BOT INITIALIZATION
 client = ExporterBot()  # Initialize immediately instead of setting to None
@@ -911,6 +3112,32 @@ BotInstance.set_instance(client)
 @handle_errors
 async def on_ready():
     print(f'Bot connected as {client.user}')
+    # on_ready fires again after reconnects; checkpoints are only picked up once
+    if not client._exports_resumed:
+        client._exports_resumed = True
+        await resume_export_jobs()
+
+@client.event
+@handle_errors
+async def on_member_update(before: discord.Member, after: discord.Member):
+    changed = {r.id for r in before.roles} ^ {r.id for r in after.roles}
+    if changed:
+        role_index.invalidate(after.guild.id, changed)
+
+@client.event
+@handle_errors
+async def on_member_remove(member: discord.Member):
+    role_index.invalidate(member.guild.id, [r.id for r in member.roles])
+
+@client.event
+@handle_errors
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    role_index.invalidate(after.guild.id, [after.id])
+
+@client.event
+@handle_errors
+async def on_guild_role_delete(role: discord.Role):
+    role_index.invalidate(role.guild.id, [role.id])
 
 @client.tree.error
 async def on_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
@@ -941,8 +3168,9 @@ async def on_command_error(interaction: discord.Interaction, error: app_commands
     search="Search term (optional)",
     date_from="Start date YYYY-MM-DD (optional)",
     date_to="End date YYYY-MM-DD (optional)",
-    chunk_size="Messages per file (optional)",
-    data_options="Data fields to include (1-6, comma separated)"
+    chunk_size="Max messages per file (optional, files are split by size otherwise)",
+    data_options="Data fields to include (1-6, comma separated)",
+    compression="Compress CSV parts (optional, zip/gzip)"
 )
 @app_commands.checks.cooldown(1, 10.0)  # 1 use per 10 seconds
 async def export(
@@ -954,8 +3182,9 @@ async def export(
     search: Optional[str] = None,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
-    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
-    data_options: Optional[str] = None
+    chunk_size: Optional[int] = None,
+    data_options: Optional[str] = None,
+    compression: Optional[Literal["zip", "gzip"]] = None
 ):
     """Export channel messages with filtering"""
     try:
@@ -977,14 +3206,14 @@ async def export(
         before = None
         if date_from:
             try:
-                after = datetime.strptime(date_from, '%Y-%m-%d')
+                after = datetime.strptime(date_from, '%Y-%m-%d').replace(tzinfo=timezone.utc)
             except ValueError:
                 await progress_message.edit(content="❌ Invalid start date format. Use YYYY-MM-DD")
                 return
                 
         if date_to:
             try:
-                before = datetime.strptime(date_to, '%Y-%m-%d')
+                before = datetime.strptime(date_to, '%Y-%m-%d').replace(tzinfo=timezone.utc)
             except ValueError:
                 await progress_message.edit(content="❌ Invalid end date format. Use YYYY-MM-DD")
                 return
@@ -994,53 +3223,30 @@ async def export(
             await progress_message.edit(content="❌ Start date must be before end date")
             return
 
-        task = asyncio.current_task()
-        if task:
-            task.user_id = interaction.user.id
-            client._active_exports.add(task)
-
-        # Initialize progress tracker
-        estimated_count = await estimate_message_count(channel, role, after, before)
-        progress = ProgressTracker(progress_message, total=estimated_count)
-
-        # Memory and cooldown checks
-        if not await client.check_memory():
-            await progress_message.edit(content="⚠️ Low memory available. Try smaller chunk size.")
-            return
-
-        if not await client.can_export():
-            await progress_message.edit(content="⏳ Please wait a few seconds between exports.")
-            return
-
-        await progress_message.edit(content="Processing your request...")
-        
-        # Check memory before starting
-        is_ok, warning = memory_monitor.check()
-        if not is_ok:
-            await progress_message.edit(content=f"❌ {warning}")
+        # A channel outside the category has nothing to export; don't fetch its history to find out
+        if category and channel.id not in {c.id for c in category.channels}:
+            await progress_message.edit(content=f"❌ #{channel.name} is not in the {category.name} category")
             return
-        elif warning:
-            logger.warning(warning)
 
-        # Fetch and process messages
-        messages = await fetch_messages_with_pagination(channel, progress)
-        
-        # Process messages
-        chunker = MessageChunker(chunk_size)
-        for message_data in messages:
-            # Check memory periodically
-            is_ok, warning = memory_monitor.check()
-            if not is_ok:
-                await progress_message.edit(content=f"❌ {warning}")
-                return
-            elif warning:
-                logger.warning(warning)
-                
-            await chunker.add_message(message_data, channel.name, format == "csv", progress_message)
-            await progress.update(filtered=True)
-            
-        # Save remaining messages
-        await chunker.finish(channel.name, format == "csv", progress_message)
+        params = {
+            'format': format,
+            'role_id': role.id,
+            'category_id': category.id if category else None,
+            'search': search,
+            'date_from': date_from,
+            'date_to': date_to,
+            'data_options': data_options,
+            'compression': compression,
+            'chunk_size': chunk_size,
+            'parts_delivered': 0,
+            'rows_delivered': 0
+        }
+        user_name = getattr(interaction.user, 'display_name', interaction.user.name)
+        job = ExportJob(
+            interaction.guild_id, interaction.user.id, user_name, channel, progress_message, params,
+            role, category, interaction
+        )
+        await submit_export_job(job)
 
     except app_commands.CommandOnCooldown as e:
         await interaction.response.send_message(
@@ -1053,9 +3259,6 @@ async def export(
             await interaction.response.send_message(f"❌ Export failed: {str(e)}")
         else:
             await interaction.followup.send(f"❌ Export failed: {str(e)}")
-    finally:
-        if task in client._active_exports:
-            client._active_exports.discard(task)
 
 @client.tree.command(name="help", description="Show detailed help information")
 async def help(interaction: discord.Interaction):
@@ -1081,7 +3284,8 @@ async def help(interaction: discord.Interaction):
             • `search` - Search in messages
             • `date_from` - Start date (YYYY-MM-DD)
             • `date_to` - End date (YYYY-MM-DD)
-            • `chunk_size` - Messages per file
+            • `chunk_size` - Max messages per file
+            • `compression` - Compress CSV parts (zip/gzip)
             """,
             inline=False
         )
@@ -1135,12 +3339,14 @@ async def status(interaction: discord.Interaction):
         return
 
     memory = psutil.virtual_memory()
-    active_exports = len(client._active_exports)
+    active_exports = len(client.scheduler.running)
     
     status_text = f"""
     **Bot Status**
     Memory Usage: {memory.percent}%
     Active Exports: {active_exports}
+    Queued Exports: {len(client.scheduler.queued)}
+    Rate Limited (429): {rate_limiter.rate_limited}
     Uptime: {time.time() - client._start_time:.0f} seconds
     """
     await interaction.response.send_message(status_text)
@@ -1148,23 +3354,18 @@ async def status(interaction: discord.Interaction):
 @client.tree.command(name="cancel", description="Cancel ongoing exports")
 @command_cooldown(5)
 async def cancel(interaction: discord.Interaction):
-    """Cancel all active exports for the user"""
+    """Cancel all queued and active exports for the user"""
     client = BotInstance.get_instance()
     if not client:
         await interaction.response.send_message("❌ Bot not initialized")
         return
 
-    cancelled = 0
-    for task in client._active_exports.copy():
-        if hasattr(task, 'user_id') and task.user_id == interaction.user.id:
-            task.cancel()
-            client._active_exports.discard(task)
-            cancelled += 1
+    cancelled = client.scheduler.cancel_where(lambda job: job.user_id == interaction.user.id)
 
     if cancelled:
-        await interaction.response.send_message(f"✅ Cancelled {cancelled} active export(s)")
+        await interaction.response.send_message(f"✅ Cancelled {cancelled} export(s)")
     else:
-        await interaction.response.send_message("❌ No active exports found")
+        await interaction.response.send_message("❌ No queued or active exports found")
 
 @client.tree.command(name="cleanup", description="Force cleanup (Admin only)")
 @app_commands.checks.has_permissions(administrator=True)
@@ -1180,10 +3381,7 @@ async def cleanup(interaction: discord.Interaction):
         message = await interaction.original_response()
         
         # Cancel all exports
-        export_count = len(client._active_exports)
-        for task in client._active_exports.copy():
-            task.cancel()
-        client._active_exports.clear()
+        export_count = client.scheduler.cancel_all()
         
         # Force garbage collection
         clear_memory()
@@ -1231,7 +3429,7 @@ async def stats(interaction: discord.Interaction):
         # Get stats
         memory = psutil.virtual_memory()
         cpu_percent = psutil.cpu_percent()
-        active_exports = len(client._active_exports)
+        active_exports = len(client.scheduler.running)
         uptime = time.time() - client._start_time
         
         # Format uptime
@@ -1284,17 +3482,17 @@ async def about(interaction: discord.Interaction):
 async def progress(interaction: discord.Interaction):
     """Show progress of current exports"""
     client = BotInstance.get_instance()
-    if not client._active_exports:
+    if not client.scheduler.running:
         await interaction.response.send_message("No active exports")
         return
 
     try:
         progress_text = "**Active Exports**\n"
-        for task in client._active_exports:
-            if hasattr(task, 'user_id'):
-                user = interaction.guild.get_member(task.user_id)
-                user_name = user.display_name if user else "Unknown"
-                progress_text += f"• Export by {user_name}\n"
+        for job in client.scheduler.running:
+            progress_text += f"• {job.describe()}\n"
+            if job.progress:
+                for line in job.progress._generate_progress_message().splitlines():
+                    progress_text += f"  {line}\n"
         
         await interaction.response.send_message(progress_text)
     except Exception as e:
@@ -1363,19 +3561,17 @@ async def commands(interaction: discord.Interaction):
 async def queue(interaction: discord.Interaction):
     """Show current export queue status"""
     client = BotInstance.get_instance()
-    if not client._active_exports:
+    scheduler = client.scheduler
+    if not scheduler.running and not scheduler.queued:
         await interaction.response.send_message("📭 Export queue is empty")
         return
 
     try:
-        queue_text = "**Export Queue Status**\n"
-        for i, task in enumerate(client._active_exports, 1):
-            if hasattr(task, 'user_id'):
-                user = interaction.guild.get_member(task.user_id)
-                user_name = user.display_name if user else "Unknown"
-                started_time = getattr(task, 'start_time', time.time())
-                duration = time.time() - started_time
-                queue_text += f"{i}. {user_name} - Running for {int(duration)}s\n"
+        queue_text = f"**Export Queue Status** ({len(scheduler.running)}/{scheduler.max_workers} running)\n"
+        for job in scheduler.running:
+            queue_text += f"▶️ {job.describe()}\n"
+        for i, job in enumerate(scheduler.waiting_order(), 1):
+            queue_text += f"{i}. {job.describe()}\n"
         
         await interaction.response.send_message(queue_text)
     except Exception as e:
@@ -1499,8 +3695,24 @@ async def detailed_stats(interaction: discord.Interaction):
             name="System Status",
             value=f"""
             Memory Usage: {memory.percent}%
-            Active Exports: {len(client._active_exports)}
+            Active Exports: {len(client.scheduler.running)}
+            Queued Exports: {len(client.scheduler.queued)}
             Maintenance Mode: {'🔧 Enabled' if stats['maintenance_mode'] else '✅ Disabled'}
+            Event Loop Lag: {loop_monitor.last_lag * 1000:.0f} ms (max {loop_monitor.max_lag * 1000:.0f} ms, {loop_monitor.stalls} stalls)
+            """,
+            inline=False
+        )
+
+        # Rate Limits
+        limits = rate_limiter.stats()
+        scopes = ", ".join(f"{scope}: {count}" for scope, count in limits['rate_limited_by_scope'].items())
+        embed.add_field(
+            name="Rate Limits",
+            value=f"""
+            API Requests: {limits['requests']:,}
+            Rate Limited (429): {limits['rate_limited']}{f" ({scopes})" if scopes else ""}
+            Retries: {limits['retries']}
+            Time Waiting: {limits['wait_time']:.1f}s
             """,
             inline=False
         )
@@ -1530,14 +3742,9 @@ async def maintenance(
         status = "🔧 enabled" if enable else "✅ disabled"  # Fixed emoji encoding
         
         if enable:
-            # Cancel all active exports
-            for task in client._active_exports.copy():
-                try:
-                    task.cancel()
-                    logger.info(f"Cancelled export task for user {getattr(task, 'user_id', 'unknown')}")
-                except Exception as e:
-                    logger.error(f"Error cancelling task: {e}")
-            client._active_exports.clear()
+            # Cancel all queued and active exports
+            cancelled = client.scheduler.cancel_all()
+            logger.info(f"Cancelled {cancelled} export(s) for maintenance")
             
             # Force cleanup
             clear_memory()
@@ -1583,6 +3790,14 @@ async def shutdown_handler():
             # Close session
             if hasattr(client, '_session') and client._session and not client._session.closed:
                 await client._session.close()
+
+            # Close message store
+            if message_store:
+                message_store.close()
+
+            serialization_executor.shutdown(wait=False, cancel_futures=True)
+            if serialization_pool:
+                serialization_pool.shutdown(wait=False, cancel_futures=True)
             
             # Close client
             if not client.is_closed():
@@ -1612,29 +3827,6 @@ def cleanup_on_exit():
     finally:
         os._exit(0)
 
-atexit.register(cleanup_on_exit)
-
-# 16. RUN BOT
-if __name__ == "__main__":
-    try:
-        # Clean up old logs
-        cleanup_old_logs()
-        
-        # Check directory permissions
-        if not data_dir.check_permissions():
-            logger.error("Failed to verify directory permissions")
-            sys.exit(1)
-        
-        # Set up signal handlers
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
-        
-        # Run bot
-        client.run(TOKEN)
-    except Exception as e:
-        logger.error(f"Startup error: {e}")
-        sys.exit(1)
-
 # Add to utility functions
 def tail_file(filename: str, n: int) -> List[str]:
     """Read last n lines from file efficiently"""
@@ -1672,75 +3864,6 @@ def tail_file(filename: str, n: int) -> List[str]:
         return []
 
 # Add to utility functions
-class StateFileManager:
-    """Manage bot state file with proper permissions and backup"""
-    def __init__(self, filename: str, backup_count: int = 3):
-        self.filename = filename
-        self.backup_count = backup_count
-        self.backup_suffix = '.backup'
-        self._ensure_directory()
-
-    def _ensure_directory(self):
-        """Ensure state directory exists with proper permissions"""
-        directory = os.path.dirname(self.filename) or '.'
-        if not os.path.exists(directory):
-            os.makedirs(directory, mode=DIR_PERMISSION)  # Use config value
-        else:
-            os.chmod(directory, DIR_PERMISSION)  # Use config value
-
-    def _create_backup(self):
-        """Create backup of state file"""
-        if os.path.exists(self.filename):
-            # Rotate backups
-            for i in range(self.backup_count - 1, 0, -1):
-                old = f"{self.filename}{self.backup_suffix}.{i}"
-                new = f"{self.filename}{self.backup_suffix}.{i+1}"
-                if os.path.exists(old):
-                    if os.path.exists(new):
-                        os.remove(new)
-                    os.rename(old, new)
-            
-            # Create new backup
-            backup = f"{self.filename}{self.backup_suffix}.1"
-            if os.path.exists(backup):
-                os.remove(backup)
-            import shutil
-            shutil.copy2(self.filename, backup)
-
-    def save(self, data: dict):
-        """Save data to state file with backup"""
-        try:
-            self._create_backup()
-            temp_file = f"{self.filename}.tmp"
-            with open(temp_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            os.replace(temp_file, self.filename)  # Atomic write
-            os.chmod(self.filename, FILE_PERMISSION)  # Use config value
-            return True
-        except Exception as e:
-            logger.error(f"Error saving state file: {e}")
-            return False
-
-    def load(self) -> Optional[dict]:
-        """Load data from state file or latest backup"""
-        files_to_try = [
-            self.filename,
-            *[f"{self.filename}{self.backup_suffix}.{i}" 
-              for i in range(1, self.backup_count + 1)]
-        ]
-        for file in files_to_try:
-            try:
-                if os.path.exists(file):
-                    with open(file, 'r') as f:
-                        data = json.load(f)
-                    if file != self.filename:
-                        logger.warning(f"Loaded state from backup: {file}")
-                    return data
-            except Exception as e:
-                logger.error(f"Error loading state from {file}: {e}")
-        
-        return None
-
 async def initialize():
     """Initialize bot with fresh state"""
     try:
@@ -1772,3 +3895,30 @@ def handle_railway_error(error_msg: str):
         print(f"- Files: {os.listdir()}")
         print("===================\n")
     sys.exit(1)
+
+# 16. RUN BOT
+def main():
+    """Start the bot, called from the run.py entry point"""
+    atexit.register(cleanup_on_exit)
+
+    try:
+        # Clean up old logs
+        cleanup_old_logs()
+        
+        # Check directory permissions
+        if not data_dir.check_permissions():
+            logger.error("Failed to verify directory permissions")
+            sys.exit(1)
+        
+        # Set up signal handlers
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+        
+        # Run bot
+        client.run(TOKEN)
+    except Exception as e:
+        logger.error(f"Startup error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Shared setup for the benchmark scripts
+
+Run the benchmarks from the repository root, e.g. ``python benchmarks/filter.py``.
+Importing the bot creates its data directory but does not connect to Discord,
+so any DISCORD_TOKEN value will do.
+"""
+
+import os
+import random
+import string
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault('DISCORD_TOKEN', 'benchmark')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+import Discord_Message_exporter as bot
+
+def make_guild(members: int = 50, role_members: int = 25):
+    """Guild whose first `role_members` members hold the returned role"""
+    role = SimpleNamespace(id=7, name='exporters', members=[])
+    guild = SimpleNamespace(id=1, name='benchmark', members={})
+    for member_id in range(1, members + 1):
+        member = SimpleNamespace(id=member_id, name=f'user{member_id}', roles=[])
+        guild.members[member_id] = member
+        if member_id <= role_members:
+            member.roles.append(role)
+            role.members.append(member)
+    guild.get_member = guild.members.get
+    role.guild = guild
+    return guild, role
+
+class FakeUser(SimpleNamespace):
+    def __str__(self):
+        return self.name
+
+def make_messages(count: int, guild, days: int = 1000, seed: int = 1):
+    """Random discord.Message stand-ins spread over `days`, newest first like a history read
+
+    Every fifth message has an attachment, a reaction and a reply, so the
+    optional fields cost what they do on a busy channel.
+    """
+    rnd = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    channel = SimpleNamespace(id=42, name='general', guild=guild)
+    messages = []
+    for index in range(count):
+        created_at = start + timedelta(seconds=rnd.random() * days * 86400)
+        member = guild.members[rnd.randint(1, len(guild.members))]
+        words = (''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(2, 9))) for _ in range(rnd.randint(3, 30)))
+        extras = index % 5 == 0
+        messages.append(SimpleNamespace(
+            id=discord.utils.time_snowflake(created_at) + rnd.randint(0, 4095),
+            author=FakeUser(id=member.id, name=member.name),
+            channel=channel,
+            content=' '.join(words),
+            created_at=created_at,
+            attachments=[SimpleNamespace(url=f'https://cdn.discordapp.com/attachments/42/{index}/image.png')] if extras else [],
+            reactions=[SimpleNamespace(emoji='👍', count=rnd.randint(1, 9))] if extras else [],
+            reference=SimpleNamespace(message_id=index) if extras else None,
+            edited_at=created_at + timedelta(minutes=5) if extras else None,
+            embeds=[],
+            pinned=False
+        ))
+    messages.sort(key=lambda message: message.id, reverse=True)
+    return channel, messages
+
+def make_records(count: int, guild, days: int = 1000, seed: int = 1):
+    """Random MessageRecords, as read back from the message store"""
+    channel, messages = make_messages(count, guild, days, seed)
+    names = {}
+    return channel, [bot.MessageRecord.from_message(message, names) for message in messages]
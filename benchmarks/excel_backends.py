@@ -0,0 +1,74 @@
+"""Excel part serialization: thread backend vs process backend
+
+Each round writes several parts of the same rows and finishes them
+concurrently, the way MessageChunker does. Reported per backend: wall time,
+time the event loop spent appending rows, and the longest event-loop stall
+while the parts were being saved.
+
+Usage: python benchmarks/excel_backends.py [rows per part ...]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+PARTS = 3
+
+async def watch_loop(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Longest gap between heartbeats beyond `interval`"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+async def run(backend: str, rows, columns):
+    with bot.SafeBuffer() as buffers:
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(watch_loop(stop))
+        start = time.perf_counter()
+        appending = 0.0
+        parts, finishing = [], []
+        for number in range(PARTS):
+            if backend == 'process':
+                part = bot.PooledExcelPartWriter(f"benchmark_part{number}.xlsx", columns)
+            else:
+                part = bot.ExcelPartWriter(f"benchmark_part{number}.xlsx", columns, buffers)
+            append_start = time.perf_counter()
+            for row in rows:
+                part.write_row(row)
+            appending += time.perf_counter() - append_start
+            parts.append(part)
+            finishing.append(asyncio.create_task(part.finish()))
+            await asyncio.sleep(0)
+        await asyncio.gather(*finishing)
+        wall = time.perf_counter() - start
+        stop.set()
+        stall = await watcher
+        for part in parts:
+            part.discard()
+    return wall, appending, stall
+
+async def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5000, 20000, 50000]
+    guild, _ = make_guild()
+    columns, build = bot.compile_row_builder(None)
+    # Start the worker processes before timing anything
+    await asyncio.get_running_loop().run_in_executor(bot.get_serialization_pool(), int)
+    print(f"{os.cpu_count()} CPUs, {PARTS} parts per round")
+    for size in sizes:
+        _, records = make_records(size, guild)
+        rows = [build(record) for record in records]
+        for backend in ('thread', 'process'):
+            wall, appending, stall = await run(backend, rows, columns)
+            print(f"{backend:8} {size:>7,} rows/part: wall {wall:6.2f}s, "
+                  f"appending {appending:6.2f}s, worst loop stall {stall * 1000:7.1f}ms")
+    bot.get_serialization_pool().shutdown()
+    bot.serialization_executor.shutdown()
+
+if __name__ == "__main__":
+    # Spawned serialization workers re-import this script; keep the bot out of them
+    from common import bot, make_guild, make_records
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Per-message cost of the export filter: compiled predicate vs the per-message coroutine
+
+Usage: python benchmarks/filter.py [messages]
+"""
+
+import asyncio
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from common import bot, make_guild, make_records
+
+async def process_message_filters(msg, role, category, channel, search, date_from, date_to):
+    """The filter as it was before compile_message_filter, for comparison"""
+    try:
+        member = channel.guild.get_member(msg.author_id)
+        if not member or role not in member.roles:
+            return False
+        if category and channel not in category.channels:
+            return False
+        if search and search.lower() not in msg.content.lower():
+            return False
+        if date_from and date_to:
+            start_date = datetime.strptime(date_from, '%Y-%m-%d')
+            end_date = datetime.strptime(date_to, '%Y-%m-%d')
+            if not (start_date <= msg.created_at.replace(tzinfo=None) <= end_date):
+                return False
+        return True
+    except Exception:
+        return False
+
+async def run_coroutine_filter(records, args):
+    return sum([await process_message_filters(record, *args) for record in records])
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    guild, role = make_guild()
+    channel, records = make_records(count, guild)
+    category = SimpleNamespace(channels=[SimpleNamespace(id=i) for i in range(30)] + [channel])
+    args = (role, category, channel, 'ab', '2020-06-01', '2022-01-01')
+
+    start = time.perf_counter()
+    matched_old = asyncio.run(run_coroutine_filter(records, args))
+    per_old = (time.perf_counter() - start) / count * 1e6
+
+    start = time.perf_counter()
+    matches = bot.compile_message_filter(*args)
+    matched_new = sum(map(matches, records))
+    per_new = (time.perf_counter() - start) / count * 1e6
+
+    print(f"{count:,} messages, {matched_new:,} matched (previous filter: {matched_old:,})")
+    print(f"coroutine filter: {per_old:.2f} us/message")
+    print(f"compiled filter:  {per_new:.2f} us/message ({per_old / per_new:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Per-message cost of turning fetched messages into export rows
+
+Compares the previous per-message dict coroutine with the compiled tuple
+builder, both starting from message objects: over LiveMessageRecord (no
+message store) and over MessageRecord.from_message (store enabled, which
+formats every field to save it).
+
+Usage: python benchmarks/row_builder.py [messages]
+"""
+
+import asyncio
+import itertools
+import sys
+import time
+
+from common import bot, make_guild, make_messages
+
+SAMPLE_SIZE = 20000  # distinct messages, cycled to reach the requested count
+
+async def create_message_data(message, data_options=None):
+    """The row builder as it was before compile_row_builder, for comparison"""
+    options = set(map(int, data_options.split(','))) if data_options else set()
+    data = {
+        'Message ID': str(message.id),
+        'Author': str(message.author),
+        'Content': message.content,
+        'Channel': message.channel.name,
+        'Timestamp': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    if 1 in options:
+        data['Attachments'] = ', '.join([a.url for a in message.attachments])
+    if 2 in options:
+        data['Reactions'] = ', '.join([f"{r.emoji}:{r.count}" for r in message.reactions])
+    if 3 in options:
+        data['Reply To'] = str(message.reference.message_id) if message.reference else ''
+    if 4 in options:
+        data['Edited'] = message.edited_at.strftime('%Y-%m-%d %H:%M:%S') if message.edited_at else ''
+    if 5 in options:
+        data['Embeds'] = len(message.embeds)
+    if 6 in options:
+        data['Pinned'] = message.pinned
+    return data
+
+async def run_dict_builder(messages, data_options):
+    for message in messages:
+        await create_message_data(message, data_options)
+
+def run_compiled(messages, build, make_record):
+    names = {}
+    for message in messages:
+        build(make_record(message, names))
+
+def timed(run, count: int) -> float:
+    start = time.perf_counter()
+    run()
+    return (time.perf_counter() - start) / count * 1e6
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    guild, _ = make_guild()
+    _, sample = make_messages(min(count, SAMPLE_SIZE), guild)
+    messages = list(itertools.islice(itertools.cycle(sample), count))
+    print(f"{count:,} messages")
+
+    for data_options in (None, '1,2,3,4,5,6'):
+        columns, build = bot.compile_row_builder(data_options)
+        per_old = timed(lambda: asyncio.run(run_dict_builder(messages, data_options)), count)
+        per_live = timed(lambda: run_compiled(messages, build, bot.LiveMessageRecord), count)
+        per_stored = timed(lambda: run_compiled(messages, build, bot.MessageRecord.from_message), count)
+        print(f"{len(columns)} columns: dict coroutine {per_old:.2f} us/message, "
+              f"live record {per_live:.2f} us/message ({per_old / per_live:.2f}x), "
+              f"stored record {per_stored:.2f} us/message ({per_old / per_stored:.2f}x)")
+
+if __name__ == "__main__":
+    main()
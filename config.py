@@ -1,10 +1,10 @@
 """Configuration settings for Discord Message Exporter Bot"""
 
+import os
+
 # Bot Settings
 VERSION = "1.0.0"
 COMMAND_PREFIX = "/"
-DEFAULT_CHUNK_SIZE = 10000
-EXPORT_COOLDOWN = 5  # seconds between exports
 MAINTENANCE_MODE = False
 
 # Memory Settings
@@ -22,11 +22,62 @@ LOG_BACKUP_COUNT = 5
 LOG_RETENTION_DAYS = 30
 
 # Export Settings
-MAX_MESSAGES_EXCEL = 100000
+MAX_MESSAGES_EXCEL = 2000000  # rows per workbook, spread over several sheets
+UPLOAD_SIZE_MARGIN = 0.95  # cut parts at this fraction of the guild's upload limit
+EXCEL_SIZE_RATIO = 0.2  # assumed xlsx size / raw cell bytes until a part is measured (chat text is ~0.15)
+COMPRESSION_SIZE_RATIO = 0.35  # assumed compressed / raw CSV bytes until a block is compressed
+COMPRESSION_QUEUE_BLOCKS = 4  # CSV_WRITE_BUFFER-sized blocks waiting for the compressor
+SERIALIZATION_WORKERS = 2  # threads that finish (save/compress) part files
+SERIALIZATION_BACKEND = "thread"  # "thread" or "process" (build Excel parts in worker processes)
+SERIALIZATION_PROCESSES = 0  # worker processes for the process backend, 0 = one per CPU
+UPLOAD_QUEUE_SIZE = 2  # finished parts waiting for upload before writing waits
+UPLOAD_RETRIES = 5  # attempts per part upload
+UPLOAD_RETRY_DELAY = 2  # seconds, grows with each failed attempt
+PART_SPOOL_MAX_MEMORY = 16 * 1024 * 1024  # part bytes kept in memory before spilling to a temp file
+MAX_CONCURRENT_EXPORTS = 2  # exports running at once, the rest wait in the queue
+MAX_EXPORTS_PER_GUILD = 1  # running exports per guild
+MAX_EXPORTS_PER_USER = 1  # running exports per user
+MAX_QUEUED_EXPORTS = 20  # waiting exports before new ones are turned away
+EXPORT_HISTORY_SIZE = 20  # finished jobs kept for /queue
+ADMISSION_MEMORY_RESERVE = 200 * 1024 * 1024  # memory kept free for the bot itself
+ADMISSION_JOB_OVERHEAD = 16 * 1024 * 1024  # pipeline queues and fetch buffers per export
+ADMISSION_CELL_OVERHEAD = 50  # Python object bytes per buffered cell
+ADMISSION_MIN_PART_ROWS = 1000  # smallest part size a downgrade may choose
+EXPORT_CHECKPOINT_FILE = "export_jobs.json"  # unfinished exports, resumed on startup
+EXPORT_RESUME_ATTEMPTS = 3  # restarts that retry an export whose parts failed to upload
 MAX_MESSAGES_CSV = 500000
 RATE_LIMIT_DELAY = 0.25  # seconds
 MAX_RETRIES = 5
+RETRY_MAX_DELAY = 30.0  # seconds, cap on the exponential backoff between retries
+RATE_LIMIT_RESERVE = 1  # requests per bucket kept back from background traffic
+PROGRESS_UPDATE_INTERVAL = 2.0  # seconds between progress message edits
+PROGRESS_MAX_INTERVAL = 30.0  # seconds, edit interval ceiling while Discord rate limits us
+PROGRESS_RATE_SMOOTHING = 0.3  # weight of the newest sample in the messages/sec average
 TIMEOUT = 30.0  # seconds
+ESTIMATE_SAMPLE_SIZE = 100  # messages sampled at each end of the range
+PIPELINE_QUEUE_SIZE = 1000  # messages buffered between export pipeline stages
+HISTORY_PAGE_SIZE = 100  # Discord's maximum messages per history request
+HISTORY_PREFETCH_DEPTH = 2  # history pages fetched ahead of the export loop
+HISTORY_FETCH_CONCURRENCY = 4  # concurrent history cursors for large ranges
+PARTITION_MIN_MESSAGES = 20000  # estimated size before history is partitioned
+PARTITION_TARGET_MESSAGES = 5000  # estimated messages per partition
+PARTITION_BUFFER_PAGES = 50  # pages buffered per partition while waiting to merge
+
+# Message Store Settings
+MESSAGE_STORE_ENABLED = True
+MESSAGE_STORE_FILE = "messages.db"
+STORE_RECHECK_HOURS = 24  # recent history re-fetched on sync to pick up edits
+STORE_READ_BATCH = 1000  # rows read from the local store per query
+ROLE_FILTER_DEPARTED_POLICY = "exclude"  # "exclude" or "include" authors who left the guild
+CSV_WRITE_BUFFER = 1024 * 1024  # bytes buffered per CSV part file
+
+# Monitoring Settings
+METRICS_PORT = int(os.getenv('METRICS_PORT') or os.getenv('PORT') or 0)  # 0 disables /metrics and /healthz
+METRICS_HOST = "0.0.0.0"
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)  # seconds
+LOOP_LAG_INTERVAL = 0.1  # seconds between event-loop heartbeats
+LOOP_STALL_THRESHOLD = 0.25  # seconds of lag logged as a stall, with the blocking stack
+LOOP_LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
 
 # Security Settings
 DIR_PERMISSION = 0o700
@@ -0,0 +1,150 @@
+"""Excel part writing for Discord Message Exporter Bot
+
+Serialization worker processes import this module to build parts, so it must
+stay free of import-time side effects: no bot state, logging or Discord client.
+"""
+
+import os
+import signal
+from array import array
+from typing import List
+
+import openpyxl
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+EXCEL_SHEET_MAX_ROWS = 1048576  # Excel's row limit per sheet, header included
+EXCEL_CELL_OVERHEAD = 16  # approximate XML bytes per cell before compression
+
+class ColumnarChunk:
+    """Append-only per-column buffers for one export part
+
+    Low-cardinality columns are dictionary encoded: each row keeps a 4-byte
+    code into the column's list of distinct values instead of its own
+    reference, and rows are decoded again as they are read back.
+    """
+    ENCODED_COLUMNS = ('Author', 'Channel')
+
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        self.data = []  # per column: list of values, or array of codes if encoded
+        self.categories = {}  # column index -> distinct values in code order
+        self._appenders = []
+        for index, name in enumerate(columns):
+            if name in self.ENCODED_COLUMNS:
+                codes = array('I')
+                self.data.append(codes)
+                self.categories[index] = []
+                self._appenders.append(self._encoder(codes, self.categories[index]))
+            else:
+                values = []
+                self.data.append(values)
+                self._appenders.append(values.append)
+        self.row_count = 0
+
+    @staticmethod
+    def _encoder(codes: array, categories: list):
+        lookup = {}
+
+        def append(value):
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(categories)
+                categories.append(value)
+            codes.append(code)
+
+        return append
+
+    def append(self, row: tuple):
+        for append, value in zip(self._appenders, row):
+            append(value)
+        self.row_count += 1
+
+    def __len__(self):
+        return self.row_count
+
+    def iter_rows(self):
+        """Yield the buffered rows as tuples, decoding encoded columns"""
+        return zip(*(
+            map(self.categories[index].__getitem__, values) if index in self.categories else values
+            for index, values in enumerate(self.data)
+        ))
+
+    def __getstate__(self):
+        # The appender closures can't be pickled; shipped chunks are only read
+        state = self.__dict__.copy()
+        del state['_appenders']
+        return state
+
+class ExcelPartWriter:
+    """Stream the rows of one Excel part with openpyxl's write-only mode
+
+    Rows are serialized to openpyxl's sheet files as they are appended instead
+    of being kept in a workbook object model, and a new sheet is started in the
+    same workbook whenever the current one reaches Excel's row limit. The
+    finished workbook is saved into ``buffer``.
+    """
+    extension = 'xlsx'
+
+    def __init__(self, filename: str, columns: List[str], buffer):
+        self.filename = filename
+        self.columns = columns
+        self.row_count = 0
+        self.sheet_count = 0
+        self.bytes_written = 0  # raw cell bytes; the saved file is compressed
+        self.file_size = None
+        self.buffer = buffer
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet = None
+        self._sheet_rows = 0
+
+    def _add_sheet(self):
+        self.sheet_count += 1
+        self._sheet = self._workbook.create_sheet(title=f"Sheet{self.sheet_count}")
+        self._sheet.append(self.columns)
+        self._sheet_rows = 1
+
+    def write_row(self, row: tuple):
+        if self._sheet is None or self._sheet_rows >= EXCEL_SHEET_MAX_ROWS:
+            self._add_sheet()
+        # openpyxl refuses control characters, e.g. the escapes in ansi code blocks
+        row = tuple([ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value for value in row])
+        self._sheet.append(row)
+        self._sheet_rows += 1
+        self.row_count += 1
+        self.bytes_written += sum(len(str(value)) for value in row) + EXCEL_CELL_OVERHEAD * len(row)
+
+    def close(self):
+        self._workbook.save(self.buffer)
+        self._workbook = self._sheet = None
+        self.file_size = self.buffer.tell()
+
+    def output(self):
+        """Return the finished part, rewound for (re)uploading"""
+        self.buffer.seek(0)
+        return self.buffer
+
+    def read_rows(self) -> List[tuple]:
+        """Read the finished part's rows back from every sheet, headers excluded, to split it"""
+        workbook = openpyxl.load_workbook(self.output(), read_only=True)
+        try:
+            return [row for sheet in workbook.worksheets for row in sheet.iter_rows(min_row=2, values_only=True)]
+        finally:
+            workbook.close()
+
+    def discard(self):
+        self.buffer.close()
+
+def write_excel_part(path: str, chunk: ColumnarChunk) -> int:
+    """Write a shipped chunk to an xlsx file in a worker process and return the file size"""
+    with open(path, 'wb') as buffer:
+        writer = ExcelPartWriter(os.path.basename(path), chunk.columns, buffer)
+        for row in chunk.iter_rows():
+            writer.write_row(row)
+        writer.close()
+    return writer.file_size
+
+def init_worker():
+    """Serialization worker initializer"""
+    # Shutdown signals are handled by the bot process, not its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
@@ -24,5 +24,9 @@ def main():
         # Local development
         import Discord_Message_exporter
 
+    # Serialization workers are spawned and re-import this script, not the bot,
+    # so keep the bot's module-level setup out of the entry point
+    Discord_Message_exporter.main()
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -20,15 +20,15 @@ if [ ! -d "/app" ]; then
 fi
 
 # Copy and set permissions
-echo "Copying bot file..."
-cp Discord_Message_exporter.py /app/
+echo "Copying bot files..."
+cp run.py Discord_Message_exporter.py excel_parts.py /app/
 if [ $? -ne 0 ]; then
-    echo "ERROR: Failed to copy bot file!"
+    echo "ERROR: Failed to copy bot files!"
     exit 1
 fi
 
 echo "Setting permissions..."
-chmod +x /app/Discord_Message_exporter.py
+chmod +x /app/run.py
 if [ $? -ne 0 ]; then
     echo "ERROR: Failed to set permissions!"
     exit 1
@@ -38,4 +38,4 @@ fi
 echo "Starting bot..."
 echo "==========================="
 cd /app
-python3 Discord_Message_exporter.py 
\ No newline at end of file
+python3 run.py 
\ No newline at end of file